@@ -0,0 +1,169 @@
+import json
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+import Agents.master_agent as master_agent
+from Agents.plan_cache import canonical_name
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+
+
+def generate_list(state: Dict[str, Any]) -> Dict[str, Any]:
+    """State update with the grocery list for one user, from the plan cache when possible"""
+    signature, plan = master_agent.cached_plan(state)
+    update = {"plan_signature": signature} if signature else {}
+    if plan is not None:
+        grocery_list = {**plan, "budget": state["budget"]}
+        update["plan_source"] = "cache"
+    else:
+        try:
+            result = master_agent.invoke_structured(
+                master_agent.GroceryList,
+                master_agent.grocery_messages(state),
+                "grocery_list_generator",
+            )
+        except Exception as e:
+            print(f"Error in batch grocery list generation: {e}")
+            result = None
+        grocery_list = (
+            result.model_dump() if result is not None else {"items": [], "budget": state["budget"]}
+        )
+    update["grocery_list"] = grocery_list
+    return update
+
+
+def price_union(grocery_lists: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """Scrape every canonical ingredient of the batch once, in one browser session.
+
+    Returns the products by canonical name and lookup counts for the report.
+    """
+    search_terms = {}
+    requested = 0
+    for grocery_list in grocery_lists:
+        for item in grocery_list.get("items", []):
+            requested += 1
+            search_terms.setdefault(canonical_name(item["name"]), item["name"])
+
+    products = {}
+    if search_terms:
+        by_term = {term.lower(): key for key, term in search_terms.items()}
+        data = master_agent.load_ingredients_data(list(search_terms.values()))
+        for product in data.get("ingredients", []):
+            key = by_term.get(product["name"].lower())
+            if key is not None:
+                products[key] = product
+    return products, {"item_lookups": requested, "unique_lookups": len(search_terms)}
+
+
+def user_price_lookups(
+    grocery_list: Dict[str, Any], products: Dict[str, Dict[str, Any]]
+) -> Dict[str, Dict[str, Any]]:
+    """Shared products keyed the way price_grocery_list looks them up (the user's own item names)"""
+    provenance = master_agent.price_provenance(1, shared=True)
+    lookups = {}
+    for item in grocery_list.get("items", []):
+        product = products.get(canonical_name(item["name"]))
+        if product is not None:
+            lookups[item["name"].lower()] = {
+                **product,
+                "name": item["name"],
+                "provenance": provenance,
+            }
+    return lookups
+
+
+def resolve_plan(graph, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one user's graph from the price check onwards; returns its last event"""
+    config = master_agent.workflow_config(state["run_id"], state.get("plan_mode"))
+    # Record the list as the grocery node's output so the run continues at price_checker
+    graph.update_state(config, state, as_node="grocery_list_generator")
+    last_event = {"event": "error", "detail": "workflow produced no events"}
+    for event in master_agent.workflow_events(graph, None, config, state):
+        last_event = event
+    return last_event
+
+
+def plan_batch(requests: List[Tuple[Dict[str, Any], str]]) -> Dict[str, Any]:
+    """Plan many (profile, user_message) requests at once with shared price lookups.
+
+    1. Generate every grocery list concurrently.
+    2. Price the union of canonical ingredient names once.
+    3. Run budget resolution and recipes per user, concurrently, with the
+       shared prices pre-loaded (budget loops only scrape genuinely new items).
+
+    The report has the lookup counts and the wall time of each phase. It has
+    no sequential baseline: per-user times measured while users run
+    concurrently say little about a sequential run. For a speedup, time the
+    same requests planned one after another (benchmarks.bench_workflow --batch).
+    """
+    master_agent.initialize_files()
+    batch_start = time.perf_counter()
+    states = [
+        master_agent.initial_workflow_state(profile, user_message)
+        for profile, user_message in requests
+    ]
+
+    phase_start = time.perf_counter()
+    with ContextThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        generated = list(pool.map(generate_list, states))
+    list_generation_s = time.perf_counter() - phase_start
+
+    phase_start = time.perf_counter()
+    products, lookups = price_union([update["grocery_list"] for update in generated])
+    pricing_s = time.perf_counter() - phase_start
+
+    graph = master_agent.build_grocery_graph(master_agent.get_checkpointer())
+    resolution_states = []
+    for state, update in zip(states, generated):
+        grocery_list = update["grocery_list"]
+        resolution_states.append(
+            {
+                **state,
+                **update,
+                "messages": state["messages"]
+                + [
+                    HumanMessage(
+                        content=json.dumps(grocery_list, indent=2),
+                        name="grocery_list_generator",
+                    )
+                ],
+                "iteration": 1,
+                "price_lookups": user_price_lookups(grocery_list, products),
+            }
+        )
+
+    phase_start = time.perf_counter()
+    with ContextThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        resolved = list(pool.map(lambda state: resolve_plan(graph, state), resolution_states))
+    resolution_s = time.perf_counter() - phase_start
+    wall_s = time.perf_counter() - batch_start
+
+    dedup_ratio = (
+        lookups["item_lookups"] / lookups["unique_lookups"] if lookups["unique_lookups"] else 1.0
+    )
+    return {
+        "plans": [
+            {
+                "run_id": state["run_id"],
+                "event": event["event"],
+                "total_price": event.get("total_price"),
+                "budget": state["budget"],
+                "recipe_count": event.get("recipe_count"),
+                "detail": event.get("detail"),
+            }
+            for state, event in zip(states, resolved)
+        ],
+        "report": {
+            "plans": len(states),
+            **lookups,
+            "dedup_ratio": dedup_ratio,
+            "list_generation_s": list_generation_s,
+            "pricing_s": pricing_s,
+            "resolution_s": resolution_s,
+            "wall_s": wall_s,
+        },
+    }
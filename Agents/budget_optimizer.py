@@ -0,0 +1,169 @@
+import math
+from typing import Any, Dict, List, Optional
+
+
+def candidate_cost(candidate: Dict[str, Any]) -> Optional[float]:
+    """Cost of buying a scraped product, or None if it has no usable price.
+
+    total_price is the quantity-aware cost from the pricing engine; the shelf
+    price is only used for entries the engine never saw.
+    """
+    if "total_price" in candidate:
+        cost = candidate["total_price"]
+        return float(cost) if isinstance(cost, (int, float)) else None
+    prices = candidate.get("prices")
+    if isinstance(prices, str) and "$" in prices:
+        try:
+            return float(prices.split("$")[1].split()[0])
+        except (IndexError, ValueError):
+            return None
+    return None
+
+
+def item_options(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The current pick followed by every distinct alternative product"""
+    current_cost = candidate_cost(item)
+    options = [{"cost": current_cost or 0.0, "penalty": 0, "product": None}]
+    if current_cost is None:
+        # Unpriced items contribute nothing to the total and cannot be swapped
+        return options
+
+    seen = {(item.get("title"), current_cost)}
+    for alternative in item.get("alternatives", []):
+        cost = candidate_cost(alternative)
+        key = (alternative.get("title"), cost)
+        if cost is None or key in seen:
+            continue
+        seen.add(key)
+        options.append({"cost": cost, "penalty": 1, "product": alternative})
+    return options
+
+
+def optimize_cart(
+    items: List[Dict[str, Any]], budget_cap: float, resolution: float = 0.05
+) -> Optional[Dict[str, Any]]:
+    """Pick one product per item so the cart fits under budget_cap.
+
+    Multiple-choice knapsack solved by dynamic programming over the cart total
+    (in steps of `resolution` dollars). The objective is the fewest swaps away
+    from the scraper's original picks; ties go to the more expensive cart,
+    which stays closest to what the grocery list asked for.
+    Returns None when even the cheapest product for every item is over budget.
+    """
+    options = [item_options(item) for item in items]
+    if sum(min(o["cost"] for o in opts) for opts in options) > budget_cap:
+        return None
+
+    cap_units = math.floor(budget_cap / resolution + 1e-9)
+    # layer[cost_units] = (penalty, previous cost_units, option index)
+    layers = []
+    frontier = {0: (0, None, None)}
+    for opts in options:
+        layer = {}
+        for units, (penalty, _, _) in frontier.items():
+            for index, option in enumerate(opts):
+                new_units = units + math.ceil(option["cost"] / resolution - 1e-9)
+                if new_units > cap_units:
+                    continue
+                new_penalty = penalty + option["penalty"]
+                best = layer.get(new_units)
+                if best is None or new_penalty < best[0]:
+                    layer[new_units] = (new_penalty, units, index)
+        if not layer:
+            return None
+        layers.append(layer)
+        frontier = layer
+
+    units = min(frontier, key=lambda u: (frontier[u][0], -u))
+    choices = []
+    for layer in reversed(layers):
+        _, previous, index = layer[units]
+        choices.append(index)
+        units = previous
+    choices.reverse()
+
+    optimized_items = []
+    swaps = []
+    total_price = 0.0
+    for item, opts, index in zip(items, options, choices):
+        option = opts[index]
+        if option["product"] is None:
+            optimized_items.append(item)
+        else:
+            product = option["product"]
+            optimized_items.append(
+                {
+                    **item,
+                    "title": product.get("title"),
+                    "price": product.get("price", item.get("price")),
+                    "unit_size": product.get("unit_size", item.get("unit_size")),
+                    "packages": product.get("packages", item.get("packages")),
+                    "total_price": option["cost"],
+                    "url": product.get("url", item.get("url")),
+                }
+            )
+            swaps.append(
+                {
+                    "name": item["name"],
+                    "from": item.get("title"),
+                    "to": product.get("title"),
+                    "saving": round(opts[0]["cost"] - option["cost"], 2),
+                }
+            )
+        total_price += option["cost"]
+
+    return {
+        "items": optimized_items,
+        "total_price": round(total_price, 2),
+        "swaps": swaps,
+    }
+
+
+# Necessity is rated by the grocery LLM from 1 (easy to drop) to 5 (essential);
+# items without a rating count as average
+MAX_NECESSITY = 5
+DEFAULT_NECESSITY = 3
+# Share of an item's cost a cheaper substitute is assumed to save at most
+SUBSTITUTION_SAVING = 0.5
+
+
+def substitution_score(item: Dict[str, Any]) -> float:
+    """Higher for expensive, dispensable items: cost x (MAX_NECESSITY + 1 - necessity)"""
+    necessity = item.get("necessity")
+    if not isinstance(necessity, (int, float)):
+        necessity = DEFAULT_NECESSITY
+    necessity = min(max(necessity, 1), MAX_NECESSITY)
+    return candidate_cost(item) * (MAX_NECESSITY + 1 - necessity)
+
+
+def plan_substitutions(items: List[Dict[str, Any]], budget_cap: float) -> List[Dict[str, Any]]:
+    """Every item to replace in one round to bring the cart under budget_cap.
+
+    Items are taken in order of substitution_score until replacing them (each
+    saving at most SUBSTITUTION_SAVING of its cost) can cover the overage. The
+    required saving is then spread over the chosen items in proportion to
+    their cost, giving each a target price for its substitute.
+    """
+    priced = [item for item in items if candidate_cost(item)]
+    overage = sum(candidate_cost(item) for item in priced) - budget_cap
+    if overage <= 0:
+        return []
+
+    chosen = []
+    for item in sorted(priced, key=substitution_score, reverse=True):
+        chosen.append(item)
+        if sum(candidate_cost(c) for c in chosen) * SUBSTITUTION_SAVING >= overage:
+            break
+
+    chosen_cost = sum(candidate_cost(item) for item in chosen)
+    keep_share = max(0.0, 1 - overage / chosen_cost)
+    return [
+        {
+            "name": item["name"],
+            "quantity": item.get("quantity"),
+            "necessity": item.get("necessity"),
+            "total_price": candidate_cost(item),
+            "target_price": round(candidate_cost(item) * keep_share, 2),
+        }
+        for item in chosen
+    ]
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, List, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumpd, dumps, loads
+
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite")
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))  # seconds
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 512))  # in-memory entries
+
+# Keys touched inside LLMCache.recording(). The pools running LLM calls copy
+# the caller's context, so their threads append to the caller's list.
+_recorded_keys: ContextVar[Optional[List[str]]] = ContextVar("llm_cache_keys", default=None)
+
+
+def serializable(value) -> bool:
+    """False if dumpd() had to replace part of value with a "not_implemented" stub"""
+    if isinstance(value, dict):
+        return value.get("type") != "not_implemented" and all(map(serializable, value.values()))
+    if isinstance(value, list):
+        return all(map(serializable, value))
+    return True
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Hash the serialized messages together with the model configuration"""
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+def chat_cache_key(model, messages, **kwargs) -> Tuple[str, str]:
+    """The (prompt, llm_string) LangChain caches model.invoke(messages, **kwargs) under.
+
+    For calls that bypass the cache, like model.stream, so they can share its entries.
+    """
+    return dumps(messages), model._get_llm_string(**kwargs)
+
+
+class LLMCache(BaseCache):
+    """Two-tier LLM response cache: an in-memory LRU in front of a SQLite file.
+
+    LangChain calls lookup/update with the serialized messages (prompt) and the
+    model parameters (llm_string), so a hit requires the same model, the same
+    temperature and the same messages. Every response is stored, so a caller
+    that rejects one (e.g. it failed schema validation) must evict it, or the
+    next identical request is answered with it again; see `recording`.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = LLM_CACHE_PATH,
+        ttl: Optional[float] = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_SIZE,
+    ):
+        self.path = path
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # key -> (expires_at, generations)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _expired(self, expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at < time.time()
+
+    def _remember(self, key: str, expires_at: Optional[float], value: RETURN_VAL_TYPE):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+        self._local.last_hit = stat != "misses"
+
+    def _record(self, key: str):
+        keys = _recorded_keys.get()
+        if keys is not None:
+            keys.append(key)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        self._record(key)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    del self._memory[key]
+                    entry = None
+                else:
+                    self._memory.move_to_end(key)
+        if entry is not None:
+            self._count("memory_hits")
+            return entry[1]
+
+        if self.path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and not self._expired(row[1]):
+                try:
+                    value = [loads(generation) for generation in json.loads(row[0])]
+                except (NotImplementedError, ValueError):
+                    value = None
+                if value is not None:
+                    self._remember(key, row[1], value)
+                    self._count("disk_hits")
+                    return value
+
+        self._count("misses")
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        key = cache_key(prompt, llm_string)
+        self._record(key)
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self._remember(key, expires_at, return_val)
+        serialized = [dumpd(generation) for generation in return_val]
+        # A parsed schema instance in additional_kwargs cannot be loaded back,
+        # so such responses are only kept in memory
+        if self.path and serializable(serialized):
+            value = json.dumps([json.dumps(generation) for generation in serialized])
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+        with self._lock:
+            self.stats["writes"] += 1
+
+    @contextmanager
+    def recording(self):
+        """Collect the keys of every lookup and update made in this context, for `evict`"""
+        keys: List[str] = []
+        token = _recorded_keys.set(keys)
+        try:
+            yield keys
+        finally:
+            _recorded_keys.reset(token)
+
+    def evict(self, keys: Iterable[str]) -> int:
+        """Drop entries from both tiers so the next identical request reaches the model"""
+        keys = set(keys)
+        if not keys:
+            return 0
+        with self._lock:
+            for key in keys:
+                self._memory.pop(key, None)
+            self.stats["evictions"] += len(keys)
+        if self.path:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(key,) for key in keys])
+        return len(keys)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM llm_cache")
+
+    def purge_expired(self) -> int:
+        """Drop expired rows from the on-disk tier"""
+        if not self.path:
+            return 0
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+    def last_lookup_hit(self) -> bool:
+        """Whether the most recent lookup on this thread was served from cache"""
+        return getattr(self._local, "last_hit", False)
+
+    def metrics(self) -> dict:
+        """Hit/miss counters plus overall and per-tier hit rates"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["lookups"] = lookups
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["memory_hit_rate"] = stats["memory_hits"] / lookups if lookups else 0.0
+        stats["disk_hit_rate"] = stats["disk_hits"] / lookups if lookups else 0.0
+        return stats
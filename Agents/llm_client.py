@@ -0,0 +1,256 @@
+import contextvars
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 3))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))  # seconds
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 8))  # seconds
+# Set LLM_HEDGE=0 to never send duplicate requests
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 95))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20))
+
+# Client errors that will fail the same way on every retry
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class MicroBatcher:
+    """Limit concurrent calls to a self-hosted server to its slots, joining duplicates.
+
+    OpenAI-compatible chat endpoints take one conversation per request, so
+    nothing is merged into a single request. Calls that arrive within
+    `window` seconds of each other are released together, and at most
+    `slots` are in flight at once; the rest wait on the client instead of
+    in the server's queue. Each call can be delayed by up to `window`. An
+    identical request (same key) already in flight is joined instead of
+    sent again. The response cache cannot catch those, because the first
+    answer has not been stored yet.
+    """
+
+    def __init__(self, slots: int, window: float):
+        self.slots = slots
+        self.window = window
+        self._queue = queue.Queue()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._free = threading.Semaphore(slots)
+        self._pool = ThreadPoolExecutor(max_workers=slots)
+        self.stats = {"requests": 0, "joined": 0, "batches": 0, "largest_batch": 0}
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def run(self, key: Optional[Hashable], fn: Callable[[], Any]) -> Any:
+        """fn() once its batch is released; key=None never joins another call"""
+        with self._lock:
+            self.stats["requests"] += 1
+            future = self._inflight.get(key) if key is not None else None
+            if future is not None:
+                self.stats["joined"] += 1
+            else:
+                future = Future()
+                if key is not None:
+                    self._inflight[key] = future
+                # Run in the caller's context so its callbacks (tracing) still apply
+                self._queue.put((key, fn, contextvars.copy_context(), future))
+        return future.result()
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.slots:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            for request in batch:
+                self._free.acquire()
+                self._pool.submit(self._execute, *request)
+
+    def _execute(self, key, fn, context, future):
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._free.release()
+            if key is not None:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["mean_batch"] = (
+            (stats["requests"] - stats["joined"]) / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
+
+
+class LLMClient:
+    """Run LLM calls under a deadline with retries and optional hedging.
+
+    Each attempt gets whatever is left of the deadline. Failed attempts are
+    retried after an exponential backoff with full jitter. Once a key has
+    enough latency samples, an attempt that is still running after that key's
+    p95 latency gets a duplicate request, and the first answer wins. Calls run
+    on a pool that copies the caller's context, so LangChain callbacks
+    (tracing) still see them.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        hedge: bool = LLM_HEDGE,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        max_workers: int = 32,
+        batcher: Optional[MicroBatcher] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.batcher = batcher
+        self._pool = ContextThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=200))
+        self.stats = defaultdict(lambda: defaultdict(int))
+
+    def _count(self, key: str, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[key][stat] += amount
+
+    def _record_latency(self, key: str, seconds: float):
+        with self._lock:
+            self._latencies[key].append(seconds)
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """Seconds after which an attempt gets a duplicate, or None while there are too few samples"""
+        with self._lock:
+            samples = sorted(self._latencies[key])
+        if not self.hedge or len(samples) < self.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return samples[index]
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        deadline: float,
+        key: str = "default",
+        hedge: bool = True,
+        max_attempts: Optional[int] = None,
+        batch_key: Optional[Hashable] = None,
+    ) -> Any:
+        """fn() within `deadline` seconds, retrying and hedging as configured.
+
+        Pass hedge=False / max_attempts=1 for calls with side effects that
+        must not run twice. With a batcher, calls sharing a batch_key while
+        one is in flight are sent once.
+        """
+        if self.batcher is not None:
+            call, fn = fn, lambda: self.batcher.run(batch_key, call)
+        deadline_at = time.monotonic() + deadline
+        last_error = None
+        for attempt in range(max_attempts or self.max_attempts):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                self._count(key, "retries")
+            try:
+                return self._attempt(fn, remaining, key, hedge)
+            except DeadlineExceeded as e:
+                last_error = e
+                break
+            except Exception as e:
+                last_error = e
+                self._count(key, "errors")
+                if getattr(e, "status_code", None) in NON_RETRYABLE_STATUS:
+                    raise
+            delay = min(self.backoff(attempt), deadline_at - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+
+        self._count(key, "failed_calls")
+        if isinstance(last_error, DeadlineExceeded) or last_error is None:
+            self._count(key, "deadline_exceeded")
+            raise DeadlineExceeded(f"{key}: no answer within {deadline:.1f}s")
+        raise last_error
+
+    def _attempt(self, fn: Callable[[], Any], timeout: float, key: str, hedge: bool) -> Any:
+        start = time.monotonic()
+        self._count(key, "attempts")
+        pending = {self._pool.submit(fn)}
+        hedge_after = self.hedge_delay(key) if hedge else None
+        hedged = None
+        error = None
+        while pending:
+            elapsed = time.monotonic() - start
+            if hedged is None and hedge_after is not None and hedge_after < timeout:
+                wait_for = max(0.0, hedge_after - elapsed)
+            else:
+                wait_for = timeout - elapsed
+            done, pending = wait(pending, timeout=max(0.0, wait_for), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self._count(key, "hedge_wins")
+                    self._record_latency(key, time.monotonic() - start)
+                    self._count(key, "successes")
+                    return future.result()
+                error = future.exception()
+            if done:
+                continue
+            if time.monotonic() - start >= timeout:
+                break
+            if hedged is None and hedge_after is not None:
+                # Still running after the usual p95: race a duplicate request
+                hedged = self._pool.submit(fn)
+                self._count(key, "hedges")
+                self._count(key, "attempts")
+                pending.add(hedged)
+
+        if pending:
+            # Abandoned requests finish in the background and are ignored
+            self._count(key, "timeouts")
+            raise DeadlineExceeded(f"{key}: attempt timed out after {timeout:.1f}s")
+        raise error
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Attempt counters per key plus p50/p95 latency of successful attempts"""
+        batching = self.batcher.metrics() if self.batcher is not None else None
+        with self._lock:
+            keys = set(self.stats) | set(self._latencies)
+            result = {}
+            for key in keys:
+                samples = sorted(self._latencies.get(key, ()))
+                result[key] = dict(self.stats.get(key, {}))
+                if samples:
+                    result[key]["p50_s"] = samples[len(samples) // 2]
+                    result[key]["p95_s"] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        if batching is not None:
+            result["micro_batching"] = batching
+        return result
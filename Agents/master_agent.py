@@ -1,25 +1,105 @@
-from typing import Literal, List, Dict, Any
-from langchain_core.messages import BaseMessage, HumanMessage
+from typing import Literal, List, Dict, Any, Optional, Tuple, get_args
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    message_chunk_to_message,
+)
+from langchain_core.outputs import ChatGeneration
 from langchain_anthropic import ChatAnthropic
-from langgraph.prebuilt import create_react_agent
 from langgraph.graph import MessagesState, END
 from langgraph.types import Command
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+import contextlib
 import json
 import os
+import re
 import getpass
+import time
+import httpx
+import sqlite3
+import threading
+import uuid
+from functools import partial
+from datetime import datetime, timezone
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langgraph.graph import StateGraph, START
+from langgraph.checkpoint.sqlite import SqliteSaver
 import sys
-from web_search.web_search_v8 import search_grocery_tracker
-import requests
+from web_search.web_search_v8 import grocery_tracker_session
+from Agents.llm_cache import LLMCache, cache_key, chat_cache_key
+from Agents.budget_optimizer import optimize_cart, plan_substitutions
+from Agents.pricing_engine import cart_total, finite_or_none, price_matrix
+from Agents.plan_cache import PlanCache, profile_signature
+from Agents.recipe_cache import RecipeCache
+from Agents.meal_solver import FoodsCatalog, solve_basket
+from Agents.price_pipeline import IncrementalItemParser, PricePrefetcher
+from Agents.speculation import SpeculativeRuns
+from Agents.tracing import TRACE_NODE_KEY, WorkflowTracer, llm_cost
+from Agents.model_router import BACKENDS, LLM_BACKEND, LLM_KEEPALIVE, Backend, ModelRouter
+from Agents.llm_client import LLM_HEDGE, LLMClient, MicroBatcher
+from app.utils.persistence import MONGO_URL, get_artifact_store, get_db, save_meal_plan
+from pymongo.errors import PyMongoError
 
 # Initialize OpenAI API key
-if not os.environ.get("OPENAI_API_KEY"):
+if BACKENDS[LLM_BACKEND].api_key is None and not os.environ.get("OPENAI_API_KEY"):
     os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your OpenAI API key: ")
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# temperature=0 makes identical prompts safe to answer from cache
+llm_cache = LLMCache()
+
+# One connection pool for every model: tiers and timeouts share warm connections
+http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=100, max_keepalive_connections=50, keepalive_expiry=LLM_KEEPALIVE
+    )
+)
+
+
+# Router and LLM client of each backend, built on first use. Switching back
+# reuses them, so the batcher's dispatcher and pools are never duplicated.
+_backends: Dict[str, Tuple[ModelRouter, LLMClient]] = {}
+
+
+def configure_backend(name: str):
+    """Point model_router and llm_client at one of BACKENDS ("hosted" or "local")"""
+    global backend, model_router, llm, llm_client
+    if name not in _backends:
+        selected = BACKENDS[name]
+        batcher = (
+            MicroBatcher(selected.batch_slots, selected.batch_window)
+            if selected.batch_slots
+            else None
+        )
+        _backends[name] = (
+            ModelRouter(partial(make_chat_model, selected), tiers=selected.tiers),
+            LLMClient(hedge=LLM_HEDGE and selected.hedge, batcher=batcher),
+        )
+    backend = BACKENDS[name]
+    model_router, llm_client = _backends[name]
+    llm = model_router.model("fast")
+
+
+def make_chat_model(backend: Backend, model_name: str, timeout: float) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=model_name,
+        temperature=0,
+        cache=llm_cache,
+        stream_usage=True,
+        timeout=timeout,
+        max_retries=0,  # llm_client retries within the deadline, then the router falls back
+        base_url=backend.base_url,
+        api_key=backend.api_key,
+        http_client=http_client,
+    )
+
+
+configure_backend(LLM_BACKEND)
 
 
 class UserProfile(BaseModel):
@@ -35,6 +115,61 @@ class UserProfile(BaseModel):
     budget: float
 
 
+class GroceryItem(BaseModel):
+    name: str = Field(description="Name of the grocery item")
+    quantity: str = Field(description="Quantity with units, e.g. '2 lbs' or '500g'")
+    necessity: Optional[int] = Field(
+        default=None, description="1 (easy to drop or replace) to 5 (essential to the plan)"
+    )
+
+
+class GroceryList(BaseModel):
+    items: List[GroceryItem]
+    budget: float
+
+
+class RecipeIngredient(BaseModel):
+    item: str = Field(description="Ingredient name")
+    quantity: str = Field(description="Amount with units")
+
+
+class RecipeNutrition(BaseModel):
+    protein: str
+    carbs: str
+    fat: str
+    calories: str
+
+
+class Recipe(BaseModel):
+    meal_name: str
+    ingredients: List[RecipeIngredient]
+    instructions: List[str]
+    nutritional_info: RecipeNutrition
+
+
+class RecipeSet(BaseModel):
+    recipes: List[Recipe]
+
+
+class GroceryWorkflowState(MessagesState):
+    run_id: str
+    profile: Dict[str, Any]
+    budget: float
+    iteration: int
+    grocery_list: Dict[str, Any]
+    recipes: Dict[str, Any]
+    prices: Dict[str, Any]
+    # Scraped product records keyed by lowercased item name, with provenance
+    price_lookups: Dict[str, Dict[str, Any]]
+    # Profile bucket of the run and whether its list came from the plan cache
+    plan_signature: str
+    plan_source: str
+    # One entry per LLM substitution round, used to detect oscillating lists
+    substitution_rounds: List[Dict[str, Any]]
+    # "llm", or "solver" to size the basket with meal_solver before recipes
+    plan_mode: str
+
+
 # File handling functions
 def extract_json_from_response(content: str) -> str:
     """Extract JSON from markdown code blocks or plain text"""
@@ -45,6 +180,244 @@ def extract_json_from_response(content: str) -> str:
     return content
 
 
+class StructuredOutputStats:
+    """Counters for schema-constrained LLM output, updated from every node and worker thread.
+
+    Every repaired response is a grocery/recipe round that would otherwise
+    have been asked again. `repaired_tokens` are the tokens of those
+    responses, and `retry_cost_avoided_usd` what asking again would have cost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "parsed": 0,
+            "repaired": 0,
+            "failed": 0,
+            "repaired_tokens": 0,
+            "retry_cost_avoided_usd": 0.0,
+        }
+
+    def count(self, stat: str, amount=1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+structured_output_stats = StructuredOutputStats()
+
+
+def repair_structured_output(schema, raw: AIMessage):
+    """Recover a schema instance from a response the structured parser rejected"""
+    candidates = [call.get("args") for call in raw.tool_calls or []]
+    for call in raw.additional_kwargs.get("tool_calls", []):
+        candidates.append(call.get("function", {}).get("arguments"))
+    if isinstance(raw.content, str):
+        candidates.append(raw.content)
+
+    for candidate in candidates:
+        if isinstance(candidate, str):
+            text = extract_json_from_response(candidate.strip())
+            start, end = text.find("{"), text.rfind("}")
+            if start == -1 or end == -1:
+                continue
+            text = re.sub(r",\s*([}\]])", r"\1", text[start : end + 1])
+            text = text.replace("\u201c", '"').replace("\u201d", '"')
+            try:
+                candidate = json.loads(text)
+            except json.JSONDecodeError:
+                continue
+        if not isinstance(candidate, dict):
+            continue
+        try:
+            return schema.model_validate(candidate)
+        except ValidationError:
+            pass
+        # Keep whichever list entries are valid instead of discarding the response
+        for field_name, field in schema.model_fields.items():
+            entry_schema = next(iter(get_args(field.annotation)), None)
+            if isinstance(candidate.get(field_name), list) and hasattr(
+                entry_schema, "model_validate"
+            ):
+                entries = []
+                for entry in candidate[field_name]:
+                    try:
+                        entries.append(entry_schema.model_validate(entry))
+                    except ValidationError:
+                        continue
+                candidate = {**candidate, field_name: entries}
+        try:
+            return schema.model_validate(candidate)
+        except ValidationError:
+            continue
+    return None
+
+
+def validate_structured(schema, raw: AIMessage, parsed=None, parsing_error=None):
+    """Return the schema instance for a response, repairing it locally if the parser rejected it"""
+    structured_output_stats.count("calls")
+    if parsed is not None:
+        structured_output_stats.count("parsed")
+        return parsed
+
+    print(f"Debug - Structured output rejected: {parsing_error}")
+    repaired = repair_structured_output(schema, raw)
+    if repaired is None:
+        structured_output_stats.count("failed")
+        return None
+
+    structured_output_stats.count("repaired")
+    usage = getattr(raw, "usage_metadata", None) or {}
+    structured_output_stats.count("repaired_tokens", usage.get("total_tokens", 0))
+    structured_output_stats.count(
+        "retry_cost_avoided_usd",
+        llm_cost(
+            raw.response_metadata.get("model_name"),
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+        ),
+    )
+    return repaired
+
+
+def invoke_structured(
+    schema, messages: List[BaseMessage], node: str = None, chain=None, accept=None
+):
+    """Call the LLM constrained to a Pydantic schema, repairing invalid output locally.
+
+    Walks the node's model chain (or the given (tier, model) chain). Each tier
+    gets the node's timeout as a deadline, within which llm_client retries and
+    hedges; a tier that misses it or errors, or whose output cannot be
+    repaired, moves on to the next tier. Returns None when every tier failed.
+    An output that cannot be repaired, or that accept(output) rejects, is
+    evicted from llm_cache, so a later identical call asks the model again
+    instead of replaying it.
+    """
+    deadline = model_router.route(node).timeout
+    # Identical concurrent requests (temperature=0) can share one call
+    request_key = json.dumps([(message.type, message.content) for message in messages])
+    for tier, model in model_router.chain(node) if chain is None else chain:
+        structured = model.with_structured_output(schema, include_raw=True)
+        with llm_cache.recording() as cache_keys:
+            try:
+                result = llm_client.call(
+                    lambda: structured.invoke(messages),
+                    deadline,
+                    f"{node or 'default'}/{tier}",
+                    batch_key=(model_router.tiers[tier], schema.__name__, request_key),
+                )
+            except Exception as e:
+                print(f"Debug - {tier} model failed for {node}: {e}")
+                model_router.record(node, tier, "error")
+                continue
+        parsed = validate_structured(
+            schema, result["raw"], result["parsed"], result["parsing_error"]
+        )
+        if parsed is not None and (accept is None or accept(parsed)):
+            model_router.record(node, tier, "ok")
+            return parsed
+        llm_cache.evict(cache_keys)
+        model_router.record(node, tier, "invalid")
+    return None
+
+
+def parse_json_output(schema, raw: AIMessage):
+    """(schema instance, None) for a JSON completion, or (None, the validation error)"""
+    try:
+        return schema.model_validate_json(extract_json_from_response(raw.content)), None
+    except ValidationError as e:
+        return None, e
+
+
+def emit_entries(result: BaseModel, on_item):
+    """Pass every list entry of a finished result to on_item"""
+    for field in result.model_dump().values():
+        for item in field if isinstance(field, list) else []:
+            on_item(item)
+
+
+def stream_structured(schema, messages: List[BaseMessage], on_item, node: str = None):
+    """Stream a schema-constrained completion, passing each completed list entry to on_item as it arrives.
+
+    Only the node's first tier streams, under the node's deadline but without
+    retries or hedging (items already handed to on_item cannot be taken back).
+    Once the deadline has passed the stream is closed and on_item is no longer
+    called. model.stream does not read llm_cache, so the cache is looked up
+    first (a hit is passed to on_item at once) and a valid streamed answer is
+    stored in it. If the stream fails, the rest of the chain is tried through
+    invoke_structured; if it finishes without validating against the schema,
+    the whole chain is. Entries of such an answer are passed to on_item at once.
+    """
+    (tier, model), *fallbacks = model_router.chain(node)
+    cache = model.cache if isinstance(model.cache, LLMCache) else None
+    prompt, llm_string = chat_cache_key(model, messages, response_format=schema)
+    cached = cache.lookup(prompt, llm_string) if cache is not None else None
+    if cached:
+        raw = cached[0].message
+        result = validate_structured(schema, raw, *parse_json_output(schema, raw))
+        if result is not None:
+            emit_entries(result, on_item)
+            return result
+        cache.evict([cache_key(prompt, llm_string)])
+
+    deadline = model_router.route(node).timeout
+    deadline_at = time.monotonic() + deadline
+    abandoned = threading.Event()
+
+    def live() -> bool:
+        return not abandoned.is_set() and time.monotonic() < deadline_at
+
+    def consume():
+        parser = IncrementalItemParser()
+        raw = None
+        with contextlib.closing(model.bind(response_format=schema).stream(messages)) as chunks:
+            for chunk in chunks:
+                if not live():
+                    break
+                raw = chunk if raw is None else raw + chunk
+                if isinstance(chunk.content, str):
+                    for item in parser.feed(chunk.content):
+                        if live():
+                            on_item(item)
+        return raw
+
+    try:
+        raw = llm_client.call(
+            consume,
+            deadline,
+            f"{node or 'default'}/{tier}/stream",
+            hedge=False,
+            max_attempts=1,
+        )
+    except Exception as e:
+        abandoned.set()
+        print(f"Debug - {tier} model failed for {node}: {e}")
+        model_router.record(node, tier, "error")
+        # The first tier has had its deadline
+        result, fallback_chain = None, fallbacks
+    else:
+        raw = AIMessage(content="") if raw is None else message_chunk_to_message(raw)
+        result = validate_structured(schema, raw, *parse_json_output(schema, raw))
+        model_router.record(node, tier, "ok" if result is not None else "invalid")
+        if result is not None and cache is not None:
+            cache.update(
+                prompt,
+                llm_string,
+                [ChatGeneration(message=AIMessage(content=result.model_dump_json()))],
+            )
+        fallback_chain = model_router.chain(node)
+
+    if result is None and fallback_chain:
+        result = invoke_structured(schema, messages, node, chain=fallback_chain)
+        if result is not None:
+            emit_entries(result, on_item)
+    return result
+
+
 def ensure_file_exists(filename: str, default_content: dict = None):
     """Create file if it doesn't exist"""
     if not os.path.exists(filename):
@@ -52,34 +425,96 @@ def ensure_file_exists(filename: str, default_content: dict = None):
             json.dump(default_content or {}, f)
 
 
-def safe_read_json(filename: str, default_content: dict = None):
-    """Safely read JSON file with fallback to default content"""
+# Grocery list, prices and recipes of each run: in Mongo when MONGO_URL is set,
+# otherwise as JSON files in the working directory
+run_artifacts = get_artifact_store()
+
+
+def save_artifact(state: Dict[str, Any], name: str, content: Dict[str, Any]):
+    """Store a run artifact; a storage failure is logged and does not fail the run"""
+    user_id = state.get("profile", {}).get("user_id")
+    try:
+        run_artifacts.write(state.get("run_id"), user_id, name, content)
+    except (OSError, PyMongoError) as e:
+        print(f"Error saving {name} for run {state.get('run_id')}: {e}")
+
+
+def load_artifact(state: Dict[str, Any], name: str) -> Dict[str, Any]:
     try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return default_content or {}
+        return run_artifacts.read(state.get("run_id"), name) or {}
+    except PyMongoError as e:
+        print(f"Error loading {name} for run {state.get('run_id')}: {e}")
+        return {}
 
 
-def safe_write_json(filename: str, content: dict):
-    """Safely write content to JSON file"""
-    with open(filename, "w") as f:
-        json.dump(content, f, indent=2)
+def last_plan(user_id: str) -> Optional[Dict[str, Any]]:
+    """The latest run with recipes for a user, without re-running anything"""
+    return run_artifacts.last_plan(user_id)
 
 
 # Initialize necessary files
 def initialize_files():
+    """Placeholder artifact files for the file store; nothing is written when Mongo holds the artifacts"""
+    if MONGO_URL:
+        return
     ensure_file_exists("agent1_output.json", {"items": [], "budget": 0})
     ensure_file_exists("item_prices.json", {"items": [], "total_price": 0, "budget": 0})
 
 
+PRICE_SOURCE = "grocerytracker.ca"
+STORE_TYPE = "nofrills"  # Example store type value
+STORE_ID = "3643"  # Example specific store value
+
+
+# Set PIPELINE_PRICING=0 to generate the whole grocery list before any scraping starts
+PIPELINE_PRICING = os.environ.get("PIPELINE_PRICING", "1") == "1"
+
+
+def open_price_session():
+    """Open a scraping session yielding search(name) -> cheapest product or None"""
+    return grocery_tracker_session(STORE_TYPE, STORE_ID)
+
+
 def load_ingredients_data(item_names):
-    store_type_value = "nofrills"  # Example store type value
-    specific_store_value = "3643"  # Example specific store value
-    out_file = "agent1_search_to_cheapest_ingredient.json"
-    search_grocery_tracker(store_type_value, specific_store_value, item_names, out_file)
-    with open(out_file, "r") as f:
-        return json.load(f)
+    with open_price_session() as search:
+        return {"ingredients": [product for product in map(search, item_names) if product]}
+
+
+# Helper calls that show up as tool spans in workflow traces
+TRACED_CALLS = ("price_lookup", "price_prefetch_wait")
+
+
+def traced_call(name: str, func, *args):
+    """Run func(*args) as a named runnable so the workflow tracer records it as a tool span"""
+    return RunnableLambda(lambda _: func(*args), name=name).invoke(None)
+
+
+def price_provenance(iteration: int, **extra) -> Dict[str, Any]:
+    """Where and when a scraped price came from"""
+    return {
+        "source": PRICE_SOURCE,
+        "store": f"{STORE_TYPE}/{STORE_ID}",
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "iteration": iteration,
+        **extra,
+    }
+
+
+# Prefetchers started by grocery_list_node, keyed by run id, and collected by price_checker_node
+price_prefetchers: Dict[str, PricePrefetcher] = {}
+price_prefetchers_lock = threading.Lock()
+
+
+def take_price_prefetcher(run_id: str):
+    with price_prefetchers_lock:
+        return price_prefetchers.pop(run_id, None)
+
+
+def discard_price_prefetcher(run_id: str):
+    """Stop a prefetcher whose results will never be collected"""
+    prefetcher = take_price_prefetcher(run_id)
+    if prefetcher is not None:
+        prefetcher.finish(timeout=0)
 
 
 def calculate_caloric_needs(profile: UserProfile) -> float:
@@ -121,23 +556,45 @@ def calculate_caloric_needs(profile: UserProfile) -> float:
     return round(total_calories)
 
 
-def create_grocery_prompt(profile: UserProfile) -> str:
-    calories = calculate_caloric_needs(profile)
+# Prompts are a static system message shared by every user followed by a short
+# per-user message. Providers only serve prompt prefixes of 1024 tokens or more
+# from their prompt cache; the grocery (~270 tokens) and recipe (~260 tokens)
+# prefixes are below that, so they are sent in full on every call.
+# Bump PROMPT_VERSION whenever a prefix changes; it is part of the prefix, so
+# cached completions for older wording stop matching.
+PROMPT_VERSION = "4"
+
+GROCERY_SYSTEM_PROMPT = f"""Prompt version {PROMPT_VERSION}.
+You are a personalized grocery list generator. Given a user profile, create a list of grocery items with quantities for one week.
+
+REQUIREMENTS:
+1. Ensure NO items from the allergens list are included
+2. Follow the dietary preferences strictly
+3. Consider medical conditions when selecting items
+4. Plan for the estimated daily caloric needs
+5. All quantities MUST include units (e.g., "2 lbs", "1 gallon", "500g", "3 pieces")
+6. Stay within the weekly budget
+7. Rate each item's "necessity" from 1 (easy to drop or replace) to 5 (essential to the plan)
+
+When a later message says the list is over budget and lists items to replace, return the whole list again with each listed item replaced by a cheaper alternative costing at most its target price (or dropped if it is not needed), and every other item unchanged.
 
-    json_structure = """
-{
+The output must be valid JSON with this structure:
+{{
     "items": [
-        {
+        {{
             "name": "item_name",
-            "quantity": "quantity_with_unit"
-        }
+            "quantity": "quantity_with_unit",
+            "necessity": 1_to_5
+        }}
     ],
     "budget": budget_amount
-}
-"""
+}}"""
+
 
-    return f"""You are a personalized grocery list generator. Create a list of grocery items with quantities for one week based on the following user profile:
-REMEMBER:
+def create_grocery_prompt(profile: UserProfile, budget: float) -> str:
+    """The per-user part of the grocery prompt; the rules live in GROCERY_SYSTEM_PROMPT"""
+    calories = calculate_caloric_needs(profile)
+    return f"""User profile:
 - Age: {profile["age"]} years
 - Sex: {profile["sex"]}
 - Height: {profile["height"]} cm
@@ -148,80 +605,120 @@ REMEMBER:
 - Goal: {profile["goal"]}
 - Medical Conditions: {', '.join(profile["medical_conditions"])}
 - Estimated Daily Caloric Needs: {calories} calories
-- Weekly Budget: ${budget}
-REQUIREMENTS:
-1. Ensure NO items from the allergens list are included
-2. Follow the dietary preferences strictly
-3. Consider medical conditions when selecting items
-4. Plan for {calories} calories per day
-5. All quantities MUST include units (e.g., "2 lbs", "1 gallon", "500g", "3 pieces")
-6. Stay within the weekly budget of ${budget}
-The output must be valid JSON with this structure:
-{json_structure}"""
+- Weekly Budget: ${budget}"""
 
 
-# Price Checker Tool
-@tool
-def find_cheapest():
-    """Read the latest grocery list and find prices for items"""
-    try:
-        print("Reading from agent1_output.json and ingredient data...")
-
-        # Read the JSON file
-        with open("agent1_output.json", "r") as f:
-            grocery_list = json.load(f)
+# Price Checker
+def price_grocery_list(
+    grocery_list: Dict[str, Any] = None,
+    price_lookups: Dict[str, Dict[str, Any]] = None,
+    iteration: int = 0,
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Find prices for the items of a grocery list (by default the latest agent1_output.json).
 
-        # Extract names of the items into a list
-        item_names = [item["name"] for item in grocery_list["items"]]
+    Items already present in price_lookups (from an earlier iteration) are not
+    scraped again. Returns the priced list and the updated lookups.
+    """
+    ingredients_dict = dict(price_lookups or {})
+    try:
+        if grocery_list is None:
+            print("Reading from agent1_output.json and ingredient data...")
+            with open("agent1_output.json", "r") as f:
+                grocery_list = json.load(f)
+
+        # Only scrape names that have not been priced in an earlier iteration
+        item_names = list(
+            dict.fromkeys(
+                item["name"]
+                for item in grocery_list["items"]
+                if item["name"].lower() not in ingredients_dict
+            )
+        )
+        print(
+            f"Scraping {len(item_names)} new items, "
+            f"{len(grocery_list['items']) - len(item_names)} already priced: {item_names}"
+        )
 
-        # Print the list of names
-        print(item_names)
+        if item_names:
+            ingredients_data = traced_call("price_lookup", load_ingredients_data, item_names)
+            provenance = price_provenance(iteration)
+            requested = {name.lower() for name in item_names}
+            for item in ingredients_data.get("ingredients", []):
+                if item["name"].lower() in requested:
+                    ingredients_dict[item["name"].lower()] = {
+                        **item,
+                        "provenance": provenance,
+                    }
 
-        ingredients_data = load_ingredients_data(item_names)
-        ingredients_dict = {
-            item["name"].lower(): item
-            for item in ingredients_data.get("ingredients", [])
-        }
+        # Price every item against every scraped candidate in one pass; the
+        # first candidate is the scraper's pick, the rest are alternatives
+        items = grocery_list.get("items", [])
+        candidates = []
+        for item in items:
+            item_data = ingredients_dict.get(item["name"].lower())
+            if item_data is None:
+                candidates.append([])
+                continue
+            alternatives = [
+                candidate
+                for candidate in item_data.get("candidates", [])
+                if (candidate.get("title"), candidate.get("url"))
+                != (item_data.get("title"), item_data.get("url"))
+            ]
+            candidates.append([item_data] + alternatives)
+        priced = price_matrix([item["quantity"] for item in items], candidates)
+        cost, packages = priced["cost"], priced["packages"]
 
         results = []
-        total_price = 0
-
-        for item in grocery_list.get("items", []):
-            item_name = item["name"].lower()
-
-            if item_name in ingredients_dict:
-                item_data = ingredients_dict[item_name]
-                quantity = item["quantity"]
-                if isinstance(quantity, str):
-                    numeric_part = "".join(filter(str.isdigit, quantity))
-                    quantity = float(numeric_part) if numeric_part else 1
-
-                # Calculate cost
-                val = float(
-                    item_data["prices"].split("$")[1]
-                )  # Extract the number part and convert it to float
-                print(f"Cost of {item_data['name']} is {val}")
-                item_total = val
-                results.append(
-                    {
-                        "name": item["name"],
-                        "quantity": item["quantity"],
-                        "price": item_data["price"],
-                        "total_price": item_total,
-                        "url": item_data["url"],
-                    }
-                )
-                total_price += item_total
-            else:
+        for i, (item, options) in enumerate(zip(items, candidates)):
+            if not options:
                 results.append(
                     {
                         "name": item["name"],
                         "quantity": item["quantity"],
+                        "necessity": item.get("necessity"),
                         "price": None,
                         "total_price": None,
                         "url": None,
                     }
                 )
+                continue
+
+            item_data = options[0]
+            fetched_in = item_data.get("provenance", {}).get("iteration", iteration)
+            item_total = finite_or_none(cost[i, 0])
+            print(f"Cost of {item['quantity']} {item_data['name']} is {item_total}")
+            results.append(
+                {
+                    "name": item["name"],
+                    "quantity": item["quantity"],
+                    "necessity": item.get("necessity"),
+                    "title": item_data.get("title"),
+                    "prices": item_data.get("prices"),
+                    "price": item_data["price"],
+                    "unit_size": item_data.get("unit_size"),
+                    "packages": finite_or_none(packages[i, 0]),
+                    "total_price": item_total,
+                    "url": item_data["url"],
+                    "provenance": {
+                        **item_data.get("provenance", {}),
+                        "reused": fetched_in < iteration,
+                    },
+                    "alternatives": [
+                        {
+                            "title": candidate.get("title"),
+                            "prices": candidate.get("prices"),
+                            "unit_size": candidate.get("unit_size"),
+                            "price": candidate.get("price"),
+                            "packages": finite_or_none(packages[i, j]),
+                            "total_price": finite_or_none(cost[i, j]),
+                            "url": candidate.get("url"),
+                        }
+                        for j, candidate in enumerate(options[1:], start=1)
+                    ],
+                }
+            )
+        total_price = cart_total(cost)
 
         output_data = {
             "items": results,
@@ -229,69 +726,199 @@ def find_cheapest():
             "budget": grocery_list.get("budget", 0),
         }
 
-        safe_write_json("item_prices.json", output_data)
-        return output_data
+        return output_data, ingredients_dict
     except Exception as e:
-        print(f"Error in find_cheapest: {str(e)}")
-        return {"error": str(e)}
+        print(f"Error in price_grocery_list: {str(e)}")
+        return {"error": str(e)}, ingredients_dict
+
+
+@tool
+def find_cheapest():
+    """Read the latest grocery list and find prices for items"""
+    prices_data, _ = price_grocery_list()
+    return prices_data
+
+
+# Set PLAN_CACHE=0 to always generate a fresh grocery list
+PLAN_CACHE = os.environ.get("PLAN_CACHE", "1") == "1"
+plan_cache = PlanCache()
+
+
+def cached_plan(state: GroceryWorkflowState) -> Tuple[str, Dict[str, Any]]:
+    """(profile signature, fresh cached list or None); the signature is None when caching is off for the user"""
+    profile = state["profile"]
+    if not PLAN_CACHE or profile.get("plan_cache") is False:
+        return None, None
+    signature = profile_signature(
+        profile, calculate_caloric_needs(profile), state["budget"]
+    )
+    return signature, plan_cache.get(signature)
+
+
+def plan_cache_node(
+    state: GroceryWorkflowState,
+) -> Command[Literal["price_checker", "grocery_list_generator"]]:
+    """Reuse the grocery list of a similar profile when one is fresh; it is still re-priced.
+
+    A profile with "plan_cache": false always gets a freshly generated list.
+    """
+    signature, plan = cached_plan(state)
+    if signature is None:
+        return Command(goto="grocery_list_generator")
+    if plan is None:
+        return Command(update={"plan_signature": signature}, goto="grocery_list_generator")
+
+    print(f"Debug - Serving cached grocery list for profile bucket {signature[:12]}")
+    grocery_list = {**plan, "budget": state["budget"]}
+    save_artifact(state, "grocery_list", grocery_list)
+    speculate_recipes(state, grocery_list)
+    return Command(
+        update={
+            "messages": [
+                HumanMessage(
+                    content=json.dumps(grocery_list, indent=2),
+                    name="grocery_list_generator",
+                )
+            ],
+            "grocery_list": grocery_list,
+            "iteration": state.get("iteration", 0) + 1,
+            "plan_signature": signature,
+            "plan_source": "cache",
+        },
+        goto="price_checker",
+    )
+
+
+def remember_plan(state: GroceryWorkflowState):
+    """Store a freshly generated list that made it to recipe generation for its profile bucket"""
+    signature = state.get("plan_signature")
+    grocery_list = state.get("grocery_list") or {}
+    if signature and state.get("plan_source") != "cache" and grocery_list.get("items"):
+        plan_cache.put(signature, {"items": grocery_list["items"]})
+
+
+def grocery_messages(state: GroceryWorkflowState) -> List[BaseMessage]:
+    return [
+        SystemMessage(content=GROCERY_SYSTEM_PROMPT),
+        HumanMessage(content=create_grocery_prompt(state["profile"], state["budget"])),
+    ] + state["messages"]
 
 
 # Grocery List Node
-def grocery_list_node(state: MessagesState) -> Command[Literal["price_checker"]]:
+def grocery_list_node(state: GroceryWorkflowState) -> Command[Literal["price_checker"]]:
     """Process grocery list generation with user profile considerations"""
-
-    result = grocery_list_agent.invoke(state)
+    iteration = state.get("iteration", 0) + 1
+    messages = grocery_messages(state)
 
     try:
-        content = result["messages"][-1].content
-        cleaned_content = extract_json_from_response(content)
-        grocery_list = json.loads(cleaned_content)
-        print("Parsed grocery list:", json.dumps(grocery_list, indent=2))
-        safe_write_json("agent1_output.json", grocery_list)
-
+        run_id = state.get("run_id")
+        if PIPELINE_PRICING and run_id:
+            # Start scraping each item as soon as its JSON object is complete
+            prefetcher = PricePrefetcher(
+                open_price_session, skip=set(state.get("price_lookups") or {})
+            )
+            with price_prefetchers_lock:
+                price_prefetchers[run_id] = prefetcher
+            grocery_list = stream_structured(
+                GroceryList,
+                messages,
+                lambda item: prefetcher.submit(item["name"]),
+                "grocery_list_generator",
+            )
+        else:
+            grocery_list = invoke_structured(GroceryList, messages, "grocery_list_generator")
     except Exception as e:
         print(f"Error in grocery list generation: {e}")
-        return Command(update={"messages": result["messages"]}, goto="price_checker")
+        grocery_list = None
 
-    result["messages"][-1] = HumanMessage(
-        content=result["messages"][-1].content, name="grocery_list_generator"
+    if grocery_list is None:
+        # Keep the last good list rather than pricing a broken one
+        grocery_list = state.get("grocery_list") or {
+            "items": [],
+            "budget": state["budget"],
+        }
+    else:
+        grocery_list = grocery_list.model_dump()
+    print("Parsed grocery list:", json.dumps(grocery_list, indent=2))
+    save_artifact(state, "grocery_list", grocery_list)
+    speculate_recipes(state, grocery_list)
+
+    return Command(
+        update={
+            "messages": [
+                HumanMessage(
+                    content=json.dumps(grocery_list, indent=2),
+                    name="grocery_list_generator",
+                )
+            ],
+            "grocery_list": grocery_list,
+            "iteration": iteration,
+        },
+        goto="price_checker",
     )
 
-    return Command(update={"messages": result["messages"]}, goto="price_checker")
 
+def price_checker_node(state: GroceryWorkflowState) -> Dict[str, Any]:
+    """Price the latest grocery list directly; pricing is deterministic so no LLM is involved"""
+    iteration = state.get("iteration", 0)
+    price_lookups = dict(state.get("price_lookups") or {})
 
-# Price Checker Agent
-price_checker_agent = create_react_agent(
-    llm,
-    tools=[find_cheapest],
-    state_modifier="You check prices and suggest substitutions if over budget.",
-)
-
+    prefetcher = take_price_prefetcher(state.get("run_id"))
+    if prefetcher is not None:
+        prefetched = traced_call("price_prefetch_wait", prefetcher.finish)
+        print(f"Debug - {len(prefetched)} items priced while the list was generating")
+        for key, product in prefetched.items():
+            price_lookups[key] = {
+                **product,
+                "provenance": price_provenance(iteration, prefetched=True),
+            }
 
-def price_checker_node(state: MessagesState) -> MessagesState:
-    result = price_checker_agent.invoke(state)
-    prices_data = safe_read_json("item_prices.json")
-    print(f"Debug - Price checker result: {json.dumps(prices_data, indent=2)}")
-    result["messages"][-1] = HumanMessage(
-        content=result["messages"][-1].content, name="price_checker"
+    prices_data, price_lookups = price_grocery_list(
+        state.get("grocery_list"), price_lookups, iteration
     )
-    return result
+    if "error" not in prices_data:
+        save_artifact(state, "prices", prices_data)
+    print(f"Debug - Price checker result: {json.dumps(prices_data, indent=2)}")
 
+    if "error" in prices_data:
+        summary = f"Price check failed: {prices_data['error']}"
+    else:
+        items = prices_data.get("items", [])
+        priced = [item for item in items if item.get("total_price") is not None]
+        summary = (
+            f"Priced {len(priced)} of {len(items)} items. "
+            f"Total ${clean_price(prices_data.get('total_price', 0)):.2f} "
+            f"against a budget of ${clean_price(prices_data.get('budget', 0)):.2f}."
+        )
+        missing = [item["name"] for item in items if item.get("total_price") is None]
+        if missing:
+            summary += f" No price found for: {', '.join(missing)}."
+        reused = [item for item in priced if item["provenance"]["reused"]]
+        summary += f" {len(reused)} prices reused from earlier iterations."
+
+    return {
+        "prices": prices_data,
+        "price_lookups": price_lookups,
+        "messages": [HumanMessage(content=summary, name="price_checker")],
+    }
+
+
+# Set RECIPE_FANOUT=0 to ask for all recipes in a single completion
+RECIPE_FANOUT = os.environ.get("RECIPE_FANOUT", "1") == "1"
+RECIPE_DAYS = 7
+RECIPE_CONCURRENCY = int(os.environ.get("RECIPE_CONCURRENCY", 4))
+RECIPE_RETRIES = int(os.environ.get("RECIPE_RETRIES", 2))
+
+
+RECIPE_SYSTEM_PROMPT = f"""Prompt version {PROMPT_VERSION}.
+You are a recipe generator that creates structured JSON output. You will be given a user profile, the ingredients the user has bought and how many recipes to write.
 
-def create_recipe_prompt(profile: UserProfile, ingredients: list) -> str:
-    return f"""Generate 7 recipes based on these ingredients and user profile. Return ONLY valid JSON.
-Profile:
-- Age: {profile["age"]}
-- Diet Preferences: {', '.join(profile["diet_preference"])}
-- Allergies: {', '.join(profile["allergies"])}
-- Medical Conditions: {', '.join(profile["medical_conditions"])}
-- Goal: {profile["goal"]}
-Available Ingredients: {', '.join(ingredients)}
 Requirements:
 1. Only use the available ingredients
 2. Respect dietary restrictions and allergies
 3. Create recipes suitable for the user's medical conditions
 4. Include detailed nutritional information
+
 Your response must be ONLY the following JSON structure, with no additional text:
 {{
     "recipes": [
@@ -318,115 +945,215 @@ Your response must be ONLY the following JSON structure, with no additional text
 }}"""
 
 
-def recipe_generator_node(state: MessagesState) -> MessagesState:
-    """Generate recipes based on available ingredients and user profile"""
-    url = "http://127.0.0.1:8000/meals/meal"
-
-    try:
-        with open(
-            "/Users/rohitshelke/Desktop/Work/Projects/uotthack7strawhats/meals.json",
-            "r",
-        ) as file:
-            data = json.load(file)
-            data = data["recipes"]
-            # Make the POST request to get nutrition data
-            for datum in data:
-                response = requests.post(
-                    url, json=datum, headers={"Authorization": f"Bearer {token}"}
-                )  # Pass the dictionary directly
-                response.raise_for_status()  # Raise an exception for HTTP errors
-            # return response.json()  # Return parsed JSON data
-    except requests.exceptions.RequestException as e:
-        print(f"Error during API call: {e}")
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        print(f"Error reading the JSON file: {e}")
-
-    url = "http://127.0.0.1:8000/grocery/grocery-list"
+def create_recipe_prompt(
+    profile: UserProfile, ingredients: list, count: int = RECIPE_DAYS, day: int = None
+) -> str:
+    """The per-request part of the recipe prompt; the rules live in RECIPE_SYSTEM_PROMPT"""
+    if day is None:
+        request = f"Generate {count} recipes based on these ingredients and user profile."
+    else:
+        # Parallel requests cannot see each other's recipes, so each day gets
+        # its own featured ingredient to keep the week varied
+        featured = ingredients[(day - 1) % len(ingredients)] if ingredients else "any"
+        request = (
+            f"Generate {count} recipe for day {day} of a {RECIPE_DAYS}-day meal plan "
+            f"based on these ingredients and user profile. Feature {featured} in it."
+        )
+    return f"""{request}
+Profile:
+- Age: {profile["age"]}
+- Diet Preferences: {', '.join(profile["diet_preference"])}
+- Allergies: {', '.join(profile["allergies"])}
+- Medical Conditions: {', '.join(profile["medical_conditions"])}
+- Goal: {profile["goal"]}
+Available Ingredients: {', '.join(ingredients)}"""
 
-    try:
-        with open("item_prices.json", "r") as file:
-            data = json.load(file)
-            data = [
-                {
-                    "ingredient_name": datum["name"],
-                    "price": datum["total_price"],
-                    "quantity": datum["quantity"],
-                }
-                for datum in data["items"]
-            ]
-            data = {"groceries": data}
-            # Make the POST request to get nutrition data
-            response = requests.post(
-                url, json=data, headers={"Authorization": f"Bearer {token}"}
-            )  # Pass the dictionary directly
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            # return response.json()  # Return parsed JSON data
-    except requests.exceptions.RequestException as e:
-        print(f"Error during API call: {e}")
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        print(f"Error reading the JSON file: {e}")
 
-    try:
-        # Read available ingredients from item_prices.json
-        with open("item_prices.json", "r") as f:
-            price_data = json.load(f)
-        ingredients = [item["name"] for item in price_data.get("items", [])]
+def recipe_messages(prompt: str) -> List[BaseMessage]:
+    return [SystemMessage(content=RECIPE_SYSTEM_PROMPT), HumanMessage(content=prompt)]
 
-        print("Debug - Available ingredients:", ingredients)
 
-        # Create the prompt first
-        prompt = create_recipe_prompt(current_profile, ingredients)
-
-        # Create recipe generation agent with the prompt as state_modifier
-        recipe_agent = create_react_agent(
-            llm,
-            tools=[],
-            state_modifier=(
-                "You are a recipe generator that creates structured JSON output. "
-                "Always ensure your output is valid JSON with all property names in double quotes. "
-                f"Your task: {prompt}"
-            ),
-        )
+def generate_day_recipes(
+    profile: UserProfile, ingredients: list, day: int, cancelled: threading.Event = None
+) -> List[Dict[str, Any]]:
+    """One day's recipe, retried up to RECIPE_RETRIES times on invalid output or API errors.
 
-        # Add the request to the state
-        if "messages" not in state:
-            state["messages"] = []
-        state["messages"].append(
-            HumanMessage(
-                content="Generate recipes based on the provided ingredients and requirements."
+    invoke_structured evicts a rejected answer from llm_cache, so a retry of
+    the same messages reaches the model instead of replaying it.
+    """
+    messages = recipe_messages(create_recipe_prompt(profile, ingredients, count=1, day=day))
+    for attempt in range(RECIPE_RETRIES + 1):
+        if cancelled is not None and cancelled.is_set():
+            return []
+        try:
+            recipe_set = invoke_structured(
+                RecipeSet,
+                messages,
+                "recipe_generator",
+                accept=lambda recipe_set: bool(recipe_set.recipes),
+            )
+        except Exception as e:
+            print(f"Debug - Recipe for day {day} failed (attempt {attempt + 1}): {e}")
+            continue
+        if recipe_set is not None:
+            return [recipe.model_dump() for recipe in recipe_set.recipes]
+        print(f"Debug - Recipe for day {day} was invalid (attempt {attempt + 1})")
+    return []
+
+
+def generate_recipes_per_day(
+    profile: UserProfile,
+    ingredients: list,
+    cancelled: threading.Event = None,
+    first_day: int = 1,
+) -> Dict[str, Any]:
+    """Generate one recipe per day from first_day on, in parallel, at most RECIPE_CONCURRENCY at a time.
+
+    A day that still fails after its retries is left out instead of failing the week.
+    """
+    days = range(first_day, RECIPE_DAYS + 1)
+    # ContextThreadPoolExecutor keeps the node's callbacks (tracing) on the worker threads
+    with ContextThreadPoolExecutor(max_workers=RECIPE_CONCURRENCY) as pool:
+        per_day = list(
+            pool.map(
+                lambda day: generate_day_recipes(profile, ingredients, day, cancelled), days
             )
         )
+    missing = [day for day, day_recipes in zip(days, per_day) if not day_recipes]
+    if missing and not (cancelled is not None and cancelled.is_set()):
+        print(f"Debug - No recipe generated for days {missing}")
+    return {"recipes": [recipe for day_recipes in per_day for recipe in day_recipes]}
+
+
+# Set RECIPE_CACHE=0 to generate every recipe
+RECIPE_CACHE = os.environ.get("RECIPE_CACHE", "1") == "1"
+recipe_cache = RecipeCache(version=PROMPT_VERSION)
+
+
+def generate_recipes(
+    profile: UserProfile, ingredients: list, cancelled: threading.Event = None
+) -> Dict[str, Any]:
+    """A week of recipes: cached ones that fit the ingredients first, then only the missing days are generated"""
+    cached = recipe_cache.lookup(profile, ingredients, RECIPE_DAYS) if RECIPE_CACHE else []
+    missing = RECIPE_DAYS - len(cached)
+    if cached:
+        print(f"Debug - {len(cached)} recipes from the recipe cache, generating {missing}")
+    if missing == 0:
+        return {"recipes": cached}
+
+    if RECIPE_FANOUT:
+        generated = generate_recipes_per_day(
+            profile, ingredients, cancelled, first_day=len(cached) + 1
+        )["recipes"]
+    else:
+        recipe_set = invoke_structured(
+            RecipeSet,
+            recipe_messages(create_recipe_prompt(profile, ingredients, count=missing)),
+            "recipe_generator",
+        )
+        generated = recipe_set.model_dump()["recipes"] if recipe_set is not None else []
+    if RECIPE_CACHE and not (cancelled is not None and cancelled.is_set()):
+        recipe_cache.put(profile, ingredients, generated)
+    return {"recipes": cached + generated}
+
+
+# Set SPECULATIVE_RECIPES=1 to start writing recipes for each new grocery list
+# while it is being priced. Most first lists pass the budget gate, and then the
+# recipes are ready (or nearly) when recipe_generator runs. Recipes only depend
+# on the ingredient names, so they are committed when recipe_generator sees the
+# same ingredients and cancelled as soon as the list is sent back for changes.
+SPECULATIVE_RECIPES = os.environ.get("SPECULATIVE_RECIPES", "0") == "1"
+speculative_recipes = SpeculativeRuns()
+# Speculative work runs as its own node in traces, not as part of the node that started it
+SPECULATIVE_NODE = "recipe_generator_speculative"
+
+
+def speculate_recipes(state: GroceryWorkflowState, grocery_list: Dict[str, Any]):
+    run_id = state.get("run_id")
+    ingredients = [item["name"] for item in grocery_list.get("items", [])]
+    # In solver mode recipes are written for the solved basket, not the list
+    if not SPECULATIVE_RECIPES or not run_id or not ingredients:
+        return
+    if state.get("plan_mode") == "solver":
+        return
+    profile = state["profile"]
+    work = RunnableLambda(
+        lambda cancelled: generate_recipes(profile, ingredients, cancelled), name=SPECULATIVE_NODE
+    )
+    speculative_recipes.start(
+        run_id,
+        tuple(ingredients),
+        lambda cancelled: work.invoke(
+            cancelled, config={"metadata": {TRACE_NODE_KEY: SPECULATIVE_NODE}}
+        ),
+    )
+
+
+def persist_meal_plan(
+    profile: Dict[str, Any], recipes: List[Dict[str, Any]], prices_data: Dict[str, Any]
+):
+    """Store the meals and grocery list in Mongo; skipped when there is no database or user"""
+    user_id = profile.get("user_id")
+    if not MONGO_URL or not user_id:
+        print("Debug - Meal plan not persisted: no MONGO_URL or user id")
+        return None
+    groceries = [
+        {
+            "ingredient_name": item["name"],
+            "price": item.get("total_price"),
+            "quantity": item.get("quantity"),
+        }
+        for item in prices_data.get("items", [])
+    ]
+    try:
+        week = save_meal_plan(user_id, recipes, groceries)
+    except PyMongoError as e:
+        print(f"Error saving meal plan: {e}")
+        return None
+    print(f"Debug - Saved {len(recipes)} meals and {len(groceries)} groceries for week {week}")
+    return week
 
-        # Generate recipes
-        result = recipe_agent.invoke(state)
 
-        print("Debug - Recipe agent raw output:", result["messages"][-1].content)
+def recipe_generator_node(state: GroceryWorkflowState) -> Dict[str, Any]:
+    """Generate recipes based on available ingredients and user profile"""
+    remember_plan(state)
+    try:
+        price_data = state.get("prices") or load_artifact(state, "prices")
+        if price_data.get("solver", {}).get("status") == "optimal":
+            # A solved basket: the recipes should use up the solved amounts
+            ingredients = [
+                f"{item['name']} ({item['quantity']})" for item in price_data["items"]
+            ]
+        else:
+            ingredients = [item["name"] for item in price_data.get("items", [])]
 
-        # Extract and parse JSON carefully
-        content = result["messages"][-1].content
-        cleaned_content = extract_json_from_response(content)
+        print("Debug - Available ingredients:", ingredients)
 
-        try:
-            recipes = json.loads(cleaned_content)
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
-            # Provide a basic structure if parsing fails
-            recipes = {"recipes": [], "error": "Failed to generate valid recipes"}
+        # Recipes started for this exact list while it was priced, if any
+        recipes = speculative_recipes.commit(state.get("run_id"), tuple(ingredients))
+        if recipes is None or not recipes["recipes"]:
+            recipes = generate_recipes(state["profile"], ingredients)
+        else:
+            print("Debug - Using recipes generated speculatively during the price check")
+        if not recipes["recipes"]:
+            recipes["error"] = "Failed to generate valid recipes"
 
         print("Debug - Parsed recipes:", json.dumps(recipes, indent=2))
-        safe_write_json("meals.json", recipes)
-
-        # Update the message in the state
-        result["messages"][-1] = HumanMessage(
-            content=json.dumps(recipes, indent=2), name="recipe_generator"
-        )
+        save_artifact(state, "recipes", recipes)
+        persist_meal_plan(state["profile"], recipes["recipes"], price_data)
 
-        return result
+        return {
+            "recipes": recipes,
+            "messages": [
+                HumanMessage(
+                    content=json.dumps(recipes, indent=2), name="recipe_generator"
+                )
+            ],
+        }
 
     except Exception as e:
         print(f"Error in recipe generation: {e}")
-        # Return the original state if there's an error
-        return state
+        return {}
 
 
 def clean_price(price_str):
@@ -440,11 +1167,13 @@ def clean_price(price_str):
 
 
 def route_by_budget(
-    state: MessagesState,
-) -> Literal["grocery_list_generator", "recipe_generator", "end"]:
-    """Route based on budget comparison"""
+    state: GroceryWorkflowState,
+) -> Literal["meal_solver", "budget_optimizer", "recipe_generator", "end"]:
+    """Route based on budget comparison; solver-mode runs go to meal_solver first"""
+    if state.get("plan_mode") == "solver" and "solver" not in (state.get("prices") or {}):
+        return "meal_solver"
     try:
-        prices_data = safe_read_json("item_prices.json")
+        prices_data = state.get("prices") or load_artifact(state, "prices")
         print("Debug - Loaded prices data:", json.dumps(prices_data, indent=2))
 
         total_price = clean_price(prices_data.get("total_price", 0))
@@ -459,38 +1188,237 @@ def route_by_budget(
             print("Debug - Routing to recipe_generator")
             return "recipe_generator"
 
-        # Over budget logic
-        items = prices_data.get("items", [])
-        valid_items = []
-        for item in items:
-            try:
-                price = clean_price(item.get("price"))
-                if price > 0:
-                    item["price"] = price
-                    valid_items.append(item)
-            except (TypeError, ValueError):
-                continue
-
-        if valid_items:
-            most_expensive = max(valid_items, key=lambda x: x["price"])
-            if "messages" not in state:
-                state["messages"] = []
-            state["messages"].append(
-                HumanMessage(
-                    content=f"The total price ${total_price:.2f} is over budget threshold "
-                    f"(${budget_threshold:.2f}). Please replace {most_expensive['name']} "
-                    f"(${most_expensive['price']:.2f}/unit) with a cheaper alternative.",
-                    name="budget_router",
-                )
-            )
-            print("Debug - Routing back to grocery_list_generator due to over budget")
-            return "grocery_list_generator"
+        print("Debug - Routing to budget_optimizer due to over budget")
+        return "budget_optimizer"
 
     except Exception as e:
         print(f"Error in route_by_budget: {e}")
         return "end"
 
 
+# Set PLAN_MODE=solver (or "plan_mode": "solver" in a profile) to size the
+# weekly basket with a linear program over the priced list
+PLAN_MODE = os.environ.get("PLAN_MODE", "llm")
+foods_catalog = FoodsCatalog(get_db)
+
+
+def meal_solver_node(
+    state: GroceryWorkflowState,
+) -> Command[Literal["recipe_generator", "budget_optimizer", "__end__"]]:
+    """Solve the cheapest basket of priced products that meets the calorie and macro targets.
+
+    Nutrients come from the `foods` collection. When there is no database or
+    the LP is infeasible, the run continues as an ordinary budget check.
+    """
+    prices_data = state.get("prices") or load_artifact(state, "prices")
+    profile = state["profile"]
+    items = [item for item in prices_data.get("items", []) if item.get("total_price") is not None]
+    try:
+        nutrients = foods_catalog.nutrients([item["name"] for item in items]) if MONGO_URL else {}
+    except PyMongoError as e:
+        print(f"Error loading nutrients: {e}")
+        nutrients = {}
+    solved = solve_basket(
+        items,
+        nutrients,
+        calculate_caloric_needs(profile),
+        clean_price(prices_data.get("budget", 0)),
+        profile,
+    )
+    summary = {key: value for key, value in solved.items() if key != "items"}
+    print(f"Debug - Meal solver: {json.dumps(summary)}")
+
+    solved_prices = {
+        "items": solved["items"],
+        "total_price": solved["total_price"],
+        "budget": prices_data.get("budget", 0),
+        "solver": summary,
+    }
+    if solved["status"] == "optimal" and route_by_budget(
+        {**state, "prices": solved_prices}
+    ) != "recipe_generator":
+        # The LP prices grams linearly; whole packages can push the basket over budget
+        summary["status"] = "over_budget"
+        summary["detail"] = f"${solved['total_price']:.2f} in whole packages"
+
+    if summary["status"] != "optimal":
+        prices_data = {**prices_data, "solver": summary}
+        route = route_by_budget({**state, "prices": prices_data})
+        return Command(
+            update={
+                "prices": prices_data,
+                "messages": [
+                    HumanMessage(
+                        content="No basket meets the nutrient targets within budget "
+                        f"({summary.get('detail', 'no usable foods')}). "
+                        "Continuing with the list as priced.",
+                        name="meal_solver",
+                    )
+                ],
+            },
+            goto=END if route == "end" else route,
+        )
+
+    save_artifact(state, "prices", solved_prices)
+    nutrients_per_day = ", ".join(
+        f"{key} {value}" for key, value in solved["nutrients_per_day"].items()
+    )
+    return Command(
+        update={
+            "prices": solved_prices,
+            "messages": [
+                HumanMessage(
+                    content=f"Solved a basket of {len(solved['items'])} products for "
+                    f"${solved['total_price']:.2f} with {nutrients_per_day} per day.",
+                    name="meal_solver",
+                )
+            ],
+        },
+        goto="recipe_generator",
+    )
+
+
+def compact_history(
+    state: GroceryWorkflowState,
+    prices_data: Dict[str, Any],
+    budget_threshold: float,
+    request: str,
+) -> List[BaseMessage]:
+    """Message update that replaces everything after the initial request with one summary.
+
+    The grocery JSON, price check and budget messages of earlier iterations are
+    removed, so the grocery prompt stays the same size however long the budget
+    loop runs.
+    """
+    items = prices_data.get("items", [])
+    total_price = clean_price(prices_data.get("total_price", 0))
+    violations = [
+        f"Total ${total_price:.2f} is over the budget threshold ${budget_threshold:.2f} "
+        f"by ${total_price - budget_threshold:.2f}"
+    ]
+    missing = [item["name"] for item in items if item.get("total_price") is None]
+    if missing:
+        violations.append(f"No price found for: {', '.join(missing)}")
+    summary = {
+        "iteration": state.get("iteration", 0),
+        "current_list": [
+            {
+                "name": item["name"],
+                "quantity": item.get("quantity"),
+                "total_price": item.get("total_price"),
+            }
+            for item in items
+        ],
+        "total_price": total_price,
+        "budget_threshold": round(budget_threshold, 2),
+        "violations": violations,
+    }
+    return [RemoveMessage(id=message.id) for message in state["messages"][1:]] + [
+        HumanMessage(
+            content=f"State of the plan so far:\n{json.dumps(summary, indent=2)}\n{request}",
+            name="budget_router",
+        )
+    ]
+
+
+def budget_optimizer_node(
+    state: GroceryWorkflowState,
+) -> Command[Literal["recipe_generator", "grocery_list_generator", "__end__"]]:
+    """Swap to cheaper scraped alternatives, falling back to the LLM only if that cannot fit the budget"""
+    prices_data = state.get("prices") or load_artifact(state, "prices")
+    total_price = clean_price(prices_data.get("total_price", 0))
+    budget = clean_price(prices_data.get("budget", 0))
+    budget_threshold = budget * 1.10
+    items = prices_data.get("items", [])
+
+    optimized = optimize_cart(items, budget_threshold)
+    if optimized is not None:
+        print(f"Debug - Optimizer swapped {len(optimized['swaps'])} items")
+        optimized_prices = {
+            "items": optimized["items"],
+            "total_price": optimized["total_price"],
+            "budget": prices_data.get("budget", 0),
+            "optimization": {
+                "feasible": True,
+                "original_total_price": total_price,
+                "swaps": optimized["swaps"],
+            },
+        }
+        save_artifact(state, "prices", optimized_prices)
+        swaps = "; ".join(
+            f"{swap['name']}: {swap['from']} -> {swap['to']} (saves ${swap['saving']:.2f})"
+            for swap in optimized["swaps"]
+        )
+        return Command(
+            update={
+                "prices": optimized_prices,
+                "messages": [
+                    HumanMessage(
+                        content=f"Swapped to cheaper products to fit the budget threshold "
+                        f"(${budget_threshold:.2f}). New total ${optimized['total_price']:.2f}. {swaps}",
+                        name="budget_optimizer",
+                    )
+                ]
+            },
+            goto="recipe_generator",
+        )
+
+    # No combination of scraped products fits: ask the LLM to substitute every
+    # item needed to get under the threshold in a single round
+    substitutions = plan_substitutions(items, budget_threshold)
+    prices_data = {
+        **prices_data,
+        "optimization": {"feasible": False, "swaps": [], "substitutions": substitutions},
+    }
+    if not substitutions:
+        print("Debug - No priced items to substitute, ending workflow")
+        save_artifact(state, "prices", prices_data)
+        return Command(update={"prices": prices_data}, goto=END)
+
+    rounds = state.get("substitution_rounds") or []
+    listed = sorted(item["name"].lower() for item in items)
+    replaced = sorted(item["name"].lower() for item in substitutions)
+    # A list seen in an earlier round, or the same items to replace twice in a
+    # row, means another round would go in circles
+    repeated_list = any(previous["items"] == listed for previous in rounds)
+    if repeated_list or (rounds and rounds[-1]["replaced"] == replaced):
+        print("Debug - Substitutions are oscillating, ending workflow")
+        prices_data["optimization"]["stopped"] = "oscillation"
+        save_artifact(state, "prices", prices_data)
+        return Command(update={"prices": prices_data}, goto=END)
+    save_artifact(state, "prices", prices_data)
+
+    print(f"Debug - Asking to replace {len(substitutions)} items: {replaced}")
+    # The ingredients change, so recipes speculated for this list are wasted.
+    # Product swaps above keep the ingredient names and can still commit them.
+    speculative_recipes.discard(state.get("run_id"))
+    request = (
+        "Replace each of these items with a cheaper alternative costing at most "
+        "its target price, or drop it if it is not needed:\n"
+        + "\n".join(
+            f"- {item['name']} ({item['quantity']}): ${item['total_price']:.2f} now, "
+            f"target ${item['target_price']:.2f}"
+            for item in substitutions
+        )
+    )
+    return Command(
+        update={
+            "prices": prices_data,
+            "messages": compact_history(state, prices_data, budget_threshold, request),
+            "substitution_rounds": rounds
+            + [
+                {
+                    "iteration": state.get("iteration", 0),
+                    "items": listed,
+                    "replaced": replaced,
+                    "total_price": total_price,
+                }
+            ],
+        },
+        goto="grocery_list_generator",
+    )
+
+
 # def retrieve_nutrition_information() -> Dict[str, Any]:
 #     """
 #     Retrieve Nutrition Information from the database for items in the price list
@@ -551,47 +1479,43 @@ def route_by_budget(
 #         return None
 
 
-def run_grocery_workflow(profile: UserProfile, jwt_token: str, user_message: str):
-    """Run the grocery list workflow with user profile"""
-    initialize_files()
-    import re
+WORKFLOW_CHECKPOINT_DB = os.environ.get(
+    "WORKFLOW_CHECKPOINT_DB", "workflow_checkpoints.sqlite"
+)
+_checkpointer = None
 
-    match = re.search(r"\$(\d+(?:\.\d+)?)", user_message)
-    global budget
-    if match:
-        value = match.group(1)  # Extract the captured value
-        budget = float(value)
-
-    # Store profile globally for recipe generation
-    global current_profile
-    global token
-    token = jwt_token
-    current_profile = profile
-
-    # Create grocery list agent with profile-based prompt
-    global grocery_list_agent
-    grocery_list_agent = create_react_agent(
-        llm, tools=[], state_modifier=create_grocery_prompt(profile)
-    )
 
-    initial_state = {
-        "messages": [
-            HumanMessage(
-                content=f"Generate a personalized grocery list based on the provided profile and requirements."
-            )
-        ]
-    }
+def get_checkpointer() -> SqliteSaver:
+    """Shared SQLite checkpointer; LangGraph saves the state after every node"""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = SqliteSaver(
+            sqlite3.connect(WORKFLOW_CHECKPOINT_DB, check_same_thread=False)
+        )
+    return _checkpointer
+
 
-    # Initialize the graph
-    workflow = StateGraph(MessagesState)
+def workflow_config(run_id: str, plan_mode: Optional[str] = None) -> Dict[str, Any]:
+    # One step for the plan cache lookup plus the original limit of 7 for the
+    # budget loop; solver runs visit meal_solver once per trip around the loop
+    recursion_limit = 8 + (2 if plan_mode == "solver" else 0)
+    return {"configurable": {"thread_id": run_id}, "recursion_limit": recursion_limit}
+
+
+def build_grocery_graph(checkpointer=None):
+    """Build and compile the grocery list -> price check -> recipe graph"""
+    workflow = StateGraph(GroceryWorkflowState)
 
     # Add nodes
+    workflow.add_node("plan_cache", plan_cache_node)
     workflow.add_node("grocery_list_generator", grocery_list_node)
     workflow.add_node("price_checker", price_checker_node)
     workflow.add_node("recipe_generator", recipe_generator_node)  # Add new node
+    workflow.add_node("budget_optimizer", budget_optimizer_node)
+    workflow.add_node("meal_solver", meal_solver_node)
 
     # Add edges with conditional routing
-    workflow.add_edge(START, "grocery_list_generator")
+    workflow.add_edge(START, "plan_cache")
     workflow.add_edge("grocery_list_generator", "price_checker")
 
     workflow.add_edge("recipe_generator", END)  # Add edge from recipe generator to end
@@ -599,46 +1523,293 @@ def run_grocery_workflow(profile: UserProfile, jwt_token: str, user_message: str
         "price_checker",
         route_by_budget,
         {
-            "grocery_list_generator": "grocery_list_generator",
+            "meal_solver": "meal_solver",
+            "budget_optimizer": "budget_optimizer",
             "recipe_generator": "recipe_generator",
             "end": END,
         },
     )
 
-    # Compile and run the graph
-    graph = workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def node_events(
+    node_name: str, node_update: Dict[str, Any], iteration: int
+) -> List[Dict[str, Any]]:
+    """Build the progress events emitted when a graph node completes"""
+    if node_name == "plan_cache":
+        if "grocery_list" not in node_update:
+            return [{"event": "plan_cache", "hit": False}]
+        grocery_list = node_update["grocery_list"]
+        return [
+            {"event": "plan_cache", "hit": True},
+            {
+                "event": "grocery_list_generated",
+                "iteration": iteration,
+                "items": grocery_list.get("items", []),
+                "budget": grocery_list.get("budget", 0),
+                "source": "plan_cache",
+            },
+        ]
+
+    if node_name == "grocery_list_generator":
+        grocery_list = node_update.get("grocery_list", {})
+        return [
+            {
+                "event": "grocery_list_generated",
+                "iteration": iteration,
+                "items": grocery_list.get("items", []),
+                "budget": grocery_list.get("budget", 0),
+            }
+        ]
+
+    if node_name == "price_checker":
+        prices_data = node_update.get("prices", {})
+        events = [
+            {
+                "event": "item_priced",
+                "iteration": iteration,
+                "name": item.get("name"),
+                "quantity": item.get("quantity"),
+                "price": item.get("price"),
+                "total_price": item.get("total_price"),
+                "url": item.get("url"),
+                "provenance": item.get("provenance"),
+            }
+            for item in prices_data.get("items", [])
+        ]
+        events.append(
+            {
+                "event": "prices_checked",
+                "iteration": iteration,
+                "total_price": prices_data.get("total_price", 0),
+                "budget": prices_data.get("budget", 0),
+            }
+        )
+        return events
+
+    if node_name == "budget_optimizer":
+        prices_data = node_update.get("prices", {})
+        optimization = prices_data.get("optimization", {})
+        return [
+            {
+                "event": "budget_optimized",
+                "iteration": iteration,
+                "feasible": optimization.get("feasible", False),
+                "swaps": optimization.get("swaps", []),
+                "substitutions": optimization.get("substitutions", []),
+                "stopped": optimization.get("stopped"),
+                "total_price": prices_data.get("total_price", 0),
+            }
+        ]
+
+    if node_name == "meal_solver":
+        prices_data = node_update.get("prices", {})
+        solver = prices_data.get("solver", {})
+        return [
+            {
+                "event": "basket_solved",
+                "iteration": iteration,
+                "status": solver.get("status"),
+                "items": prices_data.get("items", []) if solver.get("status") == "optimal" else [],
+                "total_price": prices_data.get("total_price", 0),
+                "nutrients_per_day": solver.get("nutrients_per_day"),
+                "excluded": solver.get("excluded", []),
+                "solve_ms": solver.get("solve_ms"),
+            }
+        ]
+
+    if node_name == "recipe_generator":
+        recipes = node_update.get("recipes", {})
+        return [{"event": "recipes_ready", "recipes": recipes.get("recipes", [])}]
+
+    return [{"event": "node_completed", "node": node_name}]
+
+
+def budget_decision_event(prices_data: Dict[str, Any], iteration: int) -> Dict[str, Any]:
+    """Describe the budget check made after pricing; the route is filled in once known"""
+    budget = clean_price(prices_data.get("budget", 0))
+    return {
+        "event": "budget_decision",
+        "iteration": iteration,
+        "route": None,
+        "total_price": clean_price(prices_data.get("total_price", 0)),
+        "budget": budget,
+        "budget_threshold": budget * 1.10,
+    }
+
+
+def parse_budget(profile: UserProfile, user_message: str) -> float:
+    """Take the budget from a "$amount" in the message, falling back to the profile"""
+    match = re.search(r"\$(\d+(?:\.\d+)?)", user_message)
+    if match:
+        return float(match.group(1))
+    return clean_price(profile.get("budget", 0))
 
-    events = graph.stream(
-        initial_state,
-        {"recursion_limit": 5},
-    )
 
-    for event in events:
-        step_type = event.get("type", "")
-        if step_type == "start":
-            print("\n=== Starting New Workflow ===")
-        elif step_type == "end":
+def workflow_profile(profile: UserProfile) -> Dict[str, Any]:
+    """The profile as stored in graph state: no password hash and a string user id, so it checkpoints cleanly"""
+    state_profile = {
+        key: value for key, value in dict(profile).items() if key not in ("_id", "password")
+    }
+    if "_id" in profile:
+        state_profile["user_id"] = str(profile["_id"])
+    return state_profile
+
+
+def workflow_events(graph, graph_input, config: Dict[str, Any], state: Dict[str, Any]):
+    """Stream the graph from graph_input (None resumes from the last checkpoint) as progress events"""
+    iteration = state.get("iteration", 0)
+    run_id = config["configurable"]["thread_id"]
+    tracer = WorkflowTracer(run_id, TRACED_CALLS, llm_cache.last_lookup_hit, iteration)
+    config = {**config, "callbacks": [tracer]}
+    pending_decision = None
+    final_prices = state.get("prices") or {}
+    recipes = state.get("recipes") or {}
+    try:
+        for update in graph.stream(graph_input, config):
+            for node_name, node_update in update.items():
+                node_update = node_update or {}
+                # route_by_budget is an edge, not a node: its decision shows up
+                # as the node that runs right after the price check
+                if pending_decision is not None:
+                    yield {**pending_decision, "route": node_name}
+                    pending_decision = None
+                if node_name == "grocery_list_generator" or (
+                    node_name == "plan_cache" and "grocery_list" in node_update
+                ):
+                    iteration += 1
+                yield from node_events(node_name, node_update, iteration)
+                if node_name == "price_checker":
+                    pending_decision = budget_decision_event(
+                        node_update.get("prices", {}), iteration
+                    )
+                final_prices = node_update.get("prices", final_prices)
+                recipes = node_update.get("recipes", recipes)
+    except Exception as e:
+        print(f"Error in grocery workflow: {e}")
+        yield {"event": "error", "detail": str(e), "trace": tracer.export()}
+        return
+    finally:
+        discard_price_prefetcher(run_id)
+        speculative_recipes.discard(run_id)
+        run_artifacts.end_run(run_id)
+
+    if pending_decision is not None:
+        yield {**pending_decision, "route": "end"}
+
+    yield {
+        "event": "workflow_complete",
+        "run_id": run_id,
+        "iterations": iteration,
+        "total_price": clean_price(final_prices.get("total_price", 0)),
+        "budget": clean_price(final_prices.get("budget", 0)),
+        "recipe_count": len(recipes.get("recipes", [])),
+        "llm_cache": llm_cache.metrics(),
+        "structured_output": structured_output_stats.metrics(),
+        "model_routing": model_router.metrics(),
+        "llm_backend": backend.name,
+        "llm_client": llm_client.metrics(),
+        "prompt_version": PROMPT_VERSION,
+        "plan_cache": plan_cache.metrics(),
+        "speculative_recipes": speculative_recipes.metrics(),
+        "recipe_cache": recipe_cache.metrics(),
+        "trace": tracer.export(),
+    }
+
+
+def initial_workflow_state(profile: UserProfile, user_message: str) -> Dict[str, Any]:
+    """Graph input for a new run with its own run id"""
+    return {
+        "messages": [
+            HumanMessage(
+                content=f"Generate a personalized grocery list based on the provided profile and requirements."
+            )
+        ],
+        "run_id": uuid.uuid4().hex,
+        "profile": workflow_profile(profile),
+        "budget": parse_budget(profile, user_message),
+        "plan_mode": profile.get("plan_mode") or PLAN_MODE,
+    }
+
+
+def stream_grocery_workflow(profile: UserProfile, user_message: str):
+    """Run the grocery list workflow, yielding a progress event as each node completes"""
+    initialize_files()
+
+    initial_state = initial_workflow_state(profile, user_message)
+    run_id, budget = initial_state["run_id"], initial_state["budget"]
+
+    graph = build_grocery_graph(get_checkpointer())
+
+    yield {"event": "workflow_started", "run_id": run_id, "budget": budget}
+    config = workflow_config(run_id, initial_state["plan_mode"])
+    yield from workflow_events(graph, initial_state, config, initial_state)
+
+
+def resume_grocery_workflow(run_id: str, user_id: str = None):
+    """Continue a checkpointed run from its last completed node"""
+    initialize_files()
+
+    graph = build_grocery_graph(get_checkpointer())
+    config = workflow_config(run_id)
+    snapshot = graph.get_state(config)
+    state = snapshot.values
+    if not state or (
+        user_id is not None and state.get("profile", {}).get("user_id") != user_id
+    ):
+        yield {"event": "error", "detail": f"No workflow run {run_id}"}
+        return
+
+    yield {
+        "event": "workflow_resumed",
+        "run_id": run_id,
+        "budget": state.get("budget"),
+        "next": list(snapshot.next),
+    }
+    config = workflow_config(run_id, state.get("plan_mode"))
+    yield from workflow_events(graph, None, config, state)
+
+
+def run_grocery_workflow(profile: UserProfile, user_message: str):
+    """Run the grocery list workflow with user profile"""
+    for event in stream_grocery_workflow(profile, user_message):
+        event_type = event["event"]
+        if event_type == "workflow_started":
+            print(f"\n=== Starting New Workflow {event['run_id']} ===")
+        elif event_type == "workflow_complete":
             print("\n=== Workflow Complete ===")
-            try:
-                final_prices = safe_read_json("item_prices.json")
-                recipes = safe_read_json("meals.json")
-                print("\nFinal Results:")
-                print(f"Total Price: ${final_prices.get('total_price', 0):.2f}")
-                print(f"Budget: ${final_prices.get('budget', 0):.2f}")
-                print(f"\nGenerated {len(recipes.get('recipes', []))} recipes")
-            except Exception as e:
-                print(f"Error reading final results: {e}")
+            print("\nFinal Results:")
+            print(f"Total Price: ${event['total_price']:.2f}")
+            print(f"Budget: ${event['budget']:.2f}")
+            print(f"\nGenerated {event['recipe_count']} recipes")
+            print(f"LLM cache: {event['llm_cache']}")
+            print(f"Structured output: {event['structured_output']}")
+            print(f"Model routing: {event['model_routing']}")
+            print(f"LLM attempts: {event['llm_client']}")
+            trace = event["trace"]
+            print(
+                f"Trace: {trace['wall_ms']:.0f} ms, {trace['llm_calls']} LLM calls, "
+                f"{trace['prompt_tokens']}+{trace['completion_tokens']} tokens "
+                f"({trace['cached_prompt_tokens']} prompt tokens from the provider cache), "
+                f"${trace['cost_usd']:.4f}"
+            )
+            for node, totals in trace["by_node"].items():
+                print(
+                    f"  {node}: {totals['count']}x {totals['wall_ms']:.0f} ms, "
+                    f"{totals['llm_calls']} LLM calls, ${totals['cost_usd']:.4f}"
+                )
+            for iteration, totals in trace["by_iteration"].items():
+                print(
+                    f"  iteration {iteration}: {totals['wall_ms']:.0f} ms, "
+                    f"{totals['prompt_tokens']} prompt tokens"
+                )
+        elif event_type == "error":
+            raise RuntimeError(event["detail"])
         else:
             print("\n--- Step Details ---")
-            if "messages" in event:
-                print("\nMessages:")
-                for msg in event["messages"][-1:]:
-                    print(
-                        f"{msg.name if hasattr(msg, 'name') else 'Unknown'}: {msg.content[:200]}..."
-                    )
             for key, value in event.items():
-                if key != "messages":
-                    print(f"{key}: {value}")
+                print(f"{key}: {str(value)[:200]}")
 
         print("-" * 50)
     return """Your Personalized Meal Plan is on the Way! 🍎🍽️
@@ -0,0 +1,324 @@
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from pymongo import TEXT
+from pymongo.errors import OperationFailure
+from scipy.optimize import linprog
+
+from Agents.plan_cache import canonical_name, normalized_set
+from Agents.pricing_engine import (
+    MEASURE,
+    cart_total,
+    finite_or_none,
+    parse_package,
+    price_matrix,
+)
+
+DAYS = 7
+CALORIE_TOLERANCE = 0.05  # weekly calories within +/-5% of the target
+MAX_GRAMS_PER_FOOD = 2100  # per week (300 g a day), so the basket stays varied
+FOOD_CANDIDATES = 20  # shortest matching descriptions tried per item
+
+# USDA FoodData Central nutrient numbers, amounts per 100 g
+NUTRIENT_NUMBERS = {"calories": "208", "protein": "203", "fat": "204", "carbs": "205"}
+NUTRIENT_NAMES = {
+    "calories": "energy",
+    "protein": "protein",
+    "fat": "total lipid (fat)",
+    "carbs": "carbohydrate, by difference",
+}
+KCAL_PER_GRAM = {"protein": 4, "fat": 9, "carbs": 4}
+
+# Share of calories from each macro (acceptable macronutrient distribution ranges)
+MACRO_RANGES = {"protein": (0.10, 0.35), "fat": (0.20, 0.35), "carbs": (0.45, 0.65)}
+# Goal values of the user schema ("Weight Loss", "Muscle Gain", "Both"), normalized
+HIGH_PROTEIN_GOALS = {"weight loss", "muscle gain", "build muscle", "both"}
+
+# Keywords that rule a food out for a diet preference
+MEAT = {"chicken", "beef", "pork", "turkey", "bacon", "ham", "lamb", "sausage", "veal"}
+SEAFOOD = {"fish", "tuna", "salmon", "cod", "tilapia", "sardine", "trout", "anchovy"}
+ANIMAL_PRODUCTS = {"egg", "milk", "cheese", "yogurt", "butter", "honey", "cream", "whey", "gelatin"}
+PORK = {"pork", "bacon", "ham", "sausage", "lard", "prosciutto", "pepperoni"}
+SHELLFISH = {"shrimp", "prawn", "crab", "lobster", "clam", "mussel", "oyster", "scallop"}
+GLUTEN = {"wheat", "bread", "pasta", "flour", "barley", "rye", "couscous", "bagel", "tortilla"}
+DIET_EXCLUSIONS = {
+    "vegetarian": MEAT | SEAFOOD | SHELLFISH,
+    "vegan": MEAT | SEAFOOD | SHELLFISH | ANIMAL_PRODUCTS,
+    "pescatarian": MEAT,
+    "gluten-free": GLUTEN,
+    "halal": PORK,
+    "kosher": PORK | SHELLFISH,
+}
+# Allergen terms that name a group of foods rather than a food
+ALLERGEN_GROUPS = {
+    "shellfish": SHELLFISH,
+    "fish": SEAFOOD,
+    "seafood": SEAFOOD | SHELLFISH,
+    "tree nut": {"almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "macadamia"},
+    "nut": {"almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "peanut"},
+    "dairy": {"milk", "cheese", "yogurt", "butter", "cream", "whey"},
+    "lactose": {"milk", "cheese", "yogurt", "butter", "cream", "whey"},
+    "milk": {"milk", "cheese", "yogurt", "butter", "cream", "whey"},
+    "egg": {"egg"},
+    "gluten": GLUTEN,
+    "wheat": GLUTEN,
+}
+
+
+def food_nutrients(document: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """Calories, protein, fat and carbs per 100 g from a `foods` document.
+
+    Accepts FoodData Central exports ({"nutrient": {"number", "name"}, "amount"})
+    and search results ({"nutrientNumber", "nutrientName", "value"}). Returns
+    None if the calories are missing.
+    """
+    found = {}
+    for entry in document.get("foodNutrients", []):
+        nutrient = entry.get("nutrient") or {}
+        number = str(nutrient.get("number") or entry.get("nutrientNumber") or "")
+        name = str(nutrient.get("name") or entry.get("nutrientName") or "").lower()
+        unit = str(nutrient.get("unitName") or entry.get("unitName") or "").lower()
+        amount = entry.get("amount", entry.get("value"))
+        if not isinstance(amount, (int, float)):
+            continue
+        for key, expected in NUTRIENT_NUMBERS.items():
+            if number == expected or (
+                name == NUTRIENT_NAMES[key] and (key != "calories" or unit == "kcal")
+            ):
+                found.setdefault(key, float(amount))
+    if "calories" not in found:
+        return None
+    return {key: found.get(key, 0.0) for key in NUTRIENT_NUMBERS}
+
+
+class FoodsCatalog:
+    """Nutrients per 100 g for grocery item names, looked up in the `foods` collection.
+
+    An item matches the shortest food description containing all of its
+    words ("Brown Rice" -> "Rice, brown, long-grain, raw"). A text index on
+    the descriptions narrows the candidates, and the word match, length sort
+    and limit run on the server. Lookups, misses included, are remembered for
+    the life of the process.
+    """
+
+    def __init__(self, get_db):
+        self.get_db = get_db
+        self._cache: Dict[str, Optional[Dict[str, float]]] = {}
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def collection(self):
+        collection = self.get_db()["foods"]
+        with self._lock:
+            if not self._indexed:
+                try:
+                    collection.create_index([("description", TEXT)])
+                except OperationFailure as e:
+                    # A collection has at most one text index; use the existing one
+                    print(f"Debug - Using the existing text index on foods: {e}")
+                self._indexed = True
+        return collection
+
+    def nutrients(self, names: List[str]) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for name in names:
+            key = canonical_name(name)
+            with self._lock:
+                known = key in self._cache
+            if not known:
+                value = self._lookup(key)
+                with self._lock:
+                    self._cache[key] = value
+            if self._cache[key] is not None:
+                result[name] = self._cache[key]
+        return result
+
+    def _lookup(self, key: str) -> Optional[Dict[str, float]]:
+        words = [word for word in re.split(r"\W+", key) if word]
+        if not words:
+            return None
+        pipeline = [
+            # Any of the words, from the text index
+            {"$match": {"$text": {"$search": " ".join(words)}}},
+            # All of the words, on the candidates only
+            {
+                "$match": {
+                    "$and": [
+                        {"description": {"$regex": rf"\b{re.escape(word)}", "$options": "i"}}
+                        for word in words
+                    ]
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "description": 1,
+                    "foodNutrients": 1,
+                    "length": {"$strLenCP": "$description"},
+                }
+            },
+            {"$sort": {"length": 1}},
+            {"$limit": FOOD_CANDIDATES},
+        ]
+        for document in self.collection().aggregate(pipeline):
+            nutrients = food_nutrients(document)
+            if nutrients is not None:
+                return nutrients
+        return None
+
+
+def macro_targets(goal: str) -> Dict[str, tuple]:
+    ranges = dict(MACRO_RANGES)
+    if " ".join(str(goal).replace("_", " ").lower().split()) in HIGH_PROTEIN_GOALS:
+        ranges["protein"] = (0.25, ranges["protein"][1])
+    return ranges
+
+
+def singular(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def food_words(text: str) -> List[str]:
+    return [singular(word) for word in re.split(r"[^a-z]+", canonical_name(text)) if word]
+
+
+def exclusion(name: str, profile: Dict[str, Any]) -> Optional[str]:
+    """Why a food cannot be in the basket for this profile, or None.
+
+    Allergies is free text in the user schema ("Peanuts, shellfish"); each
+    term excludes foods naming it ("peanut butter") or a food in its group
+    ("shrimp" for shellfish).
+    """
+    words = food_words(name)
+    text = " ".join(words)
+    for allergen in normalized_set(profile.get("allergies")):
+        term = " ".join(food_words(allergen))
+        group = ALLERGEN_GROUPS.get(term, set())
+        if term and (f" {term} " in f" {text} " or group & set(words)):
+            return f"allergy: {allergen}"
+    for diet in normalized_set(profile.get("diet_preference")):
+        if set(words) & {singular(word) for word in DIET_EXCLUSIONS.get(diet, set())}:
+            return f"diet: {diet}"
+    return None
+
+
+def cost_per_100g(product: Dict[str, Any]) -> Optional[float]:
+    """Price of 100 g of a scraped product; None for products sold by the piece"""
+    package = parse_package(product)
+    if package["per_gram"] is not None:
+        return package["per_gram"] * 100
+    if package["price"] is None or package["dimension"] != MEASURE:
+        return None
+    return package["price"] / package["size"] * 100
+
+
+def solve_basket(
+    items: List[Dict[str, Any]],
+    nutrients: Dict[str, Dict[str, float]],
+    daily_calories: float,
+    budget: float,
+    profile: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Cheapest weekly basket of priced products meeting the calorie and macro targets.
+
+    One variable per product (an item's pick and each of its alternatives),
+    in units of 100 g. Minimizes cost subject to weekly calories within
+    CALORIE_TOLERANCE of the target, each macro's share of calories within
+    its range, the budget, and at most MAX_GRAMS_PER_FOOD per product.
+    Items with no nutrients, no price per weight, or that the profile
+    excludes are left out and listed under "excluded".
+    """
+    start = time.perf_counter()
+    foods, excluded = [], []
+    for item in items:
+        reason = exclusion(item["name"], profile)
+        if reason is None and item["name"] not in nutrients:
+            reason = "no nutrient data"
+        for product in [item] + list(item.get("alternatives", [])):
+            cost = cost_per_100g(product)
+            if reason is None and cost is not None:
+                foods.append({"item": item, "product": product, "cost": cost})
+        if reason is None and not any(food["item"] is item for food in foods):
+            reason = "not sold by weight"
+        if reason is not None:
+            excluded.append({"name": item["name"], "reason": reason})
+
+    result = {"status": "infeasible", "items": [], "excluded": excluded, "total_price": 0.0}
+    if not foods:
+        result["solve_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    per_100g = np.array(
+        [[nutrients[food["item"]["name"]][key] for key in NUTRIENT_NUMBERS] for food in foods]
+    )
+    calories, protein, fat, carbs = per_100g.T
+    cost = np.array([food["cost"] for food in foods])
+    weekly = daily_calories * DAYS
+
+    rows, bounds_upper = [], []
+    rows.append(calories)  # calories <= target * (1 + tolerance)
+    bounds_upper.append(weekly * (1 + CALORIE_TOLERANCE))
+    rows.append(-calories)  # calories >= target * (1 - tolerance)
+    bounds_upper.append(-weekly * (1 - CALORIE_TOLERANCE))
+    for key, grams in (("protein", protein), ("fat", fat), ("carbs", carbs)):
+        low, high = macro_targets(profile.get("goal", ""))[key]
+        macro_kcal = grams * KCAL_PER_GRAM[key]
+        rows.append(low * calories - macro_kcal)  # share >= low
+        bounds_upper.append(0.0)
+        rows.append(macro_kcal - high * calories)  # share <= high
+        bounds_upper.append(0.0)
+    rows.append(cost)
+    bounds_upper.append(budget)
+
+    solution = linprog(
+        cost,
+        A_ub=np.array(rows),
+        b_ub=np.array(bounds_upper),
+        bounds=[(0, MAX_GRAMS_PER_FOOD / 100)] * len(foods),
+        method="highs",
+    )
+    result["solve_ms"] = (time.perf_counter() - start) * 1000
+    if not solution.success:
+        result["detail"] = solution.message
+        return result
+
+    amounts = solution.x
+    chosen = [(food, round(amount * 100)) for food, amount in zip(foods, amounts)]
+    chosen = [(food, grams) for food, grams in chosen if grams >= 1]
+    # The LP prices grams linearly; the shopper buys whole packages
+    priced = price_matrix(
+        [f"{grams} g" for _, grams in chosen], [[food["product"]] for food, _ in chosen]
+    )
+    basket = []
+    for i, (food, grams) in enumerate(chosen):
+        product = food["product"]
+        basket.append(
+            {
+                "name": food["item"]["name"],
+                "quantity": f"{grams} g",
+                "grams": grams,
+                "title": product.get("title"),
+                "prices": product.get("prices"),
+                "unit_size": product.get("unit_size"),
+                "packages": finite_or_none(priced["packages"][i, 0]),
+                "total_price": finite_or_none(priced["cost"][i, 0]),
+                "url": product.get("url"),
+            }
+        )
+    totals = per_100g.T @ amounts
+    result.update(
+        {
+            "status": "optimal",
+            "items": basket,
+            "total_price": cart_total(priced["cost"]) if chosen else 0.0,
+            "lp_cost": round(float(cost @ amounts), 2),
+            "nutrients_per_day": {
+                key: round(float(total) / DAYS, 1) for key, total in zip(NUTRIENT_NUMBERS, totals)
+            },
+            "calorie_target": daily_calories,
+        }
+    )
+    return result
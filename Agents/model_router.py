@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+
+# Model behind each tier. Point LLM_BASE_URL at any OpenAI-compatible server
+# (vLLM, Ollama, llama.cpp, a test double) to run the whole graph against it.
+MODEL_TIERS = {
+    "fast": os.environ.get("LLM_FAST_MODEL", "gpt-4o-mini"),
+    "quality": os.environ.get("LLM_QUALITY_MODEL", "gpt-4o"),
+}
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL") or None
+
+# LLM_BACKEND=local runs every tier on a self-hosted OpenAI-compatible server
+# (Ollama by default; vLLM and llama.cpp's server work the same way)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "hosted")
+LOCAL_LLM_BASE_URL = os.environ.get("LOCAL_LLM_BASE_URL", "http://localhost:11434/v1")
+LOCAL_LLM_MODEL = os.environ.get("LOCAL_LLM_MODEL", "llama3.2:latest")
+LOCAL_LLM_QUALITY_MODEL = os.environ.get("LOCAL_LLM_QUALITY_MODEL", LOCAL_LLM_MODEL)
+# Sequences the local server decodes in parallel (OLLAMA_NUM_PARALLEL, vLLM max_num_seqs)
+LOCAL_LLM_SLOTS = int(os.environ.get("LOCAL_LLM_SLOTS", 4))
+LOCAL_LLM_BATCH_WINDOW = float(os.environ.get("LOCAL_LLM_BATCH_WINDOW", 0.02))  # seconds
+# Idle HTTP connections are kept open this long so calls skip the TCP/TLS handshake
+LLM_KEEPALIVE = float(os.environ.get("LLM_KEEPALIVE", 60))  # seconds
+
+
+@dataclass(frozen=True)
+class Backend:
+    """Where the chat models live and how calls to them are dispatched"""
+
+    name: str
+    tiers: Dict[str, str]
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None  # None uses OPENAI_API_KEY
+    hedge: bool = True
+    # Client-side micro-batching for servers with a fixed number of slots
+    batch_slots: int = 0
+    batch_window: float = 0.0
+
+
+BACKENDS = {
+    "hosted": Backend("hosted", MODEL_TIERS, LLM_BASE_URL),
+    # Hedging only adds load to a server that is already the bottleneck
+    "local": Backend(
+        "local",
+        {"fast": LOCAL_LLM_MODEL, "quality": LOCAL_LLM_QUALITY_MODEL},
+        LOCAL_LLM_BASE_URL,
+        api_key=os.environ.get("LOCAL_LLM_API_KEY", "local"),
+        hedge=False,
+        batch_slots=LOCAL_LLM_SLOTS,
+        batch_window=LOCAL_LLM_BATCH_WINDOW,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class NodeRoute:
+    """Which tier a node starts on, how long one call may take, and where it goes next"""
+
+    tier: str
+    timeout: float  # seconds per call on a tier, retries and hedges included
+    fallbacks: Tuple[str, ...] = ()
+
+
+# Nodes start on the fast tier and escalate to the quality tier when a call
+# times out, errors or returns output that cannot be repaired
+NODE_ROUTES = {
+    "grocery_list_generator": NodeRoute("fast", timeout=30, fallbacks=("quality",)),
+    "recipe_generator": NodeRoute("fast", timeout=20, fallbacks=("quality",)),
+}
+DEFAULT_ROUTE = NodeRoute("fast", timeout=60)
+
+
+class ModelRouter:
+    """Resolve a node to its ordered chain of chat models and count how each attempt ended.
+
+    `make_model(model_name, timeout)` builds the chat model for a tier; models
+    are built once per (model, timeout) pair and reused.
+    """
+
+    def __init__(
+        self,
+        make_model: Callable[[str, float], BaseChatModel],
+        routes: Dict[str, NodeRoute] = NODE_ROUTES,
+        tiers: Dict[str, str] = MODEL_TIERS,
+    ):
+        self.make_model = make_model
+        self.routes = routes
+        self.tiers = tiers
+        self._models = {}
+        self._lock = threading.Lock()
+        self.stats = defaultdict(lambda: defaultdict(int))
+
+    def model(self, tier: str, timeout: float = DEFAULT_ROUTE.timeout) -> BaseChatModel:
+        key = (self.tiers[tier], timeout)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self.make_model(*key)
+            return self._models[key]
+
+    def route(self, node: Optional[str]) -> NodeRoute:
+        return self.routes.get(node, DEFAULT_ROUTE)
+
+    def chain(self, node: Optional[str]) -> List[Tuple[str, BaseChatModel]]:
+        """(tier, model) pairs to try in order for a call made by `node`"""
+        route = self.route(node)
+        tiers = list(dict.fromkeys((route.tier, *route.fallbacks)))
+        # Falling back to the same model again (one local model for every tier) is pointless
+        models = {}
+        for tier in tiers:
+            models.setdefault(self.tiers[tier], tier)
+        return [(tier, self.model(tier, route.timeout)) for tier in models.values()]
+
+    def record(self, node: Optional[str], tier: str, outcome: str):
+        """Count an attempt; outcome is "ok", "invalid" or "error" """
+        with self._lock:
+            self.stats[f"{node or 'default'}/{tier}"][outcome] += 1
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {key: dict(counts) for key, counts in self.stats.items()}
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Union
+
+PLAN_CACHE_PATH = os.environ.get("PLAN_CACHE_PATH", "plan_cache.sqlite")
+PLAN_CACHE_TTL = float(os.environ.get("PLAN_CACHE_TTL", 3 * 24 * 3600))  # seconds
+CALORIE_BAND = 200  # kcal per day
+BUDGET_BAND = 10  # dollars per week
+
+NO_ENTRY = {"", "none", "n/a", "na", "no", "nil", "not applicable", "no allergies"}
+# Free-text profile fields list several terms: "Peanuts, shellfish and soy"
+TERM_SEPARATOR = re.compile(r"[,;\n&]|\band\b", re.I)
+
+
+def normalized_set(values: Union[str, Iterable[str], None]) -> list:
+    """Lowercased, de-duplicated terms with "None"-style placeholders dropped.
+
+    Takes a list (diet_preference) or a free-text string (allergies and
+    medical_conditions are plain strings in the user schema), and splits
+    every entry on commas, semicolons, "&" and "and" into whole terms.
+    """
+    if isinstance(values, str):
+        values = [values]
+    terms = set()
+    for value in values or ():
+        terms.update(" ".join(term.split()).lower() for term in TERM_SEPARATOR.split(str(value)))
+    return sorted(terms - NO_ENTRY)
+
+
+def normalized_goal(goal: Any) -> str:
+    """"Weight Loss", "weight_loss" and " weight  loss" are the same goal"""
+    return " ".join(str(goal or "").replace("_", " ").lower().split())
+
+
+def canonical_name(name: str) -> str:
+    """"Greek Yogurt (non-fat)" and "greek  yogurt" are the same ingredient"""
+    name = re.sub(r"\([^)]*\)", " ", name.lower())
+    return " ".join(name.split())
+
+
+def profile_signature(profile: Dict[str, Any], calories: float, budget: float) -> str:
+    """Hash of the quantized inputs that shape a grocery list.
+
+    Profiles in the same calorie band and budget band with the same goal,
+    diet, allergen and medical-condition sets get the same signature.
+    """
+    bucket = {
+        "calorie_band": math.floor(calories / CALORIE_BAND),
+        "budget_band": math.floor(budget / BUDGET_BAND),
+        "goal": normalized_goal(profile.get("goal")),
+        "diet": normalized_set(profile.get("diet_preference")),
+        "allergies": normalized_set(profile.get("allergies")),
+        "medical_conditions": normalized_set(profile.get("medical_conditions")),
+    }
+    return hashlib.sha256(json.dumps(bucket, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """Grocery lists that made it to recipe generation, keyed by profile signature.
+
+    Entries older than `ttl` seconds are ignored, so prices are always fresh
+    (plans are re-priced on every hit) and lists are regenerated periodically.
+    """
+
+    def __init__(self, path: Optional[str] = PLAN_CACHE_PATH, ttl: float = PLAN_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "writes": 0}
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS plan_cache ("
+                    "signature TEXT PRIMARY KEY, plan TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, signature: str) -> Optional[Dict[str, Any]]:
+        """The stored grocery list for a signature, or None if missing or past the freshness window"""
+        if not self.path:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT plan, created_at FROM plan_cache WHERE signature = ?", (signature,)
+            ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        if self.ttl and row[1] < time.time() - self.ttl:
+            self._count("stale")
+            return None
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, signature: str, plan: Dict[str, Any]):
+        if not self.path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO plan_cache (signature, plan, created_at) VALUES (?, ?, ?)",
+                (signature, json.dumps(plan), time.time()),
+            )
+        self._count("writes")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"] + stats["stale"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,115 @@
+import json
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class IncrementalItemParser:
+    """Pull complete JSON objects out of a streamed completion as soon as they close.
+
+    Only objects that are elements of an array are emitted, so for
+    {"items": [{"name": ..., "quantity": ...}, ...]} each item comes out as
+    soon as its closing brace arrives, long before the whole document parses.
+    Objects nested inside an item stay part of that item.
+    """
+
+    def __init__(self, required_key: str = "name"):
+        self.required_key = required_key
+        self.buffer = ""
+        self.position = 0
+        self.stack = []  # "{" / "[" for every open container
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add a chunk of the completion and return the items it completed"""
+        self.buffer += text
+        completed = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if (
+                    char == "{"
+                    and self.object_start is None
+                    and self.stack
+                    and self.stack[-1] == "["
+                ):
+                    self.object_start = (self.position, len(self.stack))
+                self.stack.append(char)
+            elif char in "}]" and self.stack:
+                self.stack.pop()
+                if (
+                    char == "}"
+                    and self.object_start is not None
+                    and self.object_start[1] == len(self.stack)
+                ):
+                    completed.extend(self._emit(self.object_start[0], self.position))
+                    self.object_start = None
+            self.position += 1
+        return completed
+
+    def _emit(self, start: int, end: int) -> List[Dict[str, Any]]:
+        try:
+            item = json.loads(self.buffer[start : end + 1])
+        except json.JSONDecodeError:
+            return []
+        if isinstance(item, dict) and self.required_key in item:
+            return [item]
+        return []
+
+
+class PricePrefetcher:
+    """Background worker that prices items while the grocery list is still streaming.
+
+    `open_session` is a context manager factory yielding a search(name)
+    function (see web_search_v8.grocery_tracker_session). The browser starts
+    with the first submitted item and is reused for the rest.
+    """
+
+    def __init__(self, open_session: Callable, skip: Optional[set] = None):
+        self.open_session = open_session
+        self.skip = {name.lower() for name in skip or ()}
+        self.submitted = set()
+        self.results = {}
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, name: str):
+        """Queue an item name for pricing unless it is already known or queued"""
+        key = name.lower()
+        if key in self.skip or key in self.submitted:
+            return
+        self.submitted.add(key)
+        self.queue.put(name)
+
+    def finish(self, timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Stop accepting items, wait for the queue to drain and return lookups by lowercased name"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+        return dict(self.results)
+
+    def _run(self):
+        name = self.queue.get()
+        if name is None:
+            return
+        try:
+            # Open the browser lazily: nothing to scrape means no browser at all
+            with self.open_session() as search:
+                while name is not None:
+                    product = search(name)
+                    if product:
+                        self.results[name.lower()] = product
+                    name = self.queue.get()
+        except Exception as e:
+            print(f"Error in price prefetcher: {e}")
@@ -0,0 +1,171 @@
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Quantities are reduced to one of two dimensions: a count of pieces, or a
+# measure in grams. Volumes are folded into grams at the density of water,
+# which is close enough for the oils, milks and juices on a grocery list.
+COUNT, MEASURE = 0, 1
+
+UNITS = {
+    "mg": (MEASURE, 0.001),
+    "g": (MEASURE, 1.0),
+    "gram": (MEASURE, 1.0),
+    "kg": (MEASURE, 1000.0),
+    "kilogram": (MEASURE, 1000.0),
+    "oz": (MEASURE, 28.3495),
+    "ounce": (MEASURE, 28.3495),
+    "lb": (MEASURE, 453.592),
+    "lbs": (MEASURE, 453.592),
+    "pound": (MEASURE, 453.592),
+    "ml": (MEASURE, 1.0),
+    "l": (MEASURE, 1000.0),
+    "liter": (MEASURE, 1000.0),
+    "litre": (MEASURE, 1000.0),
+    "cup": (MEASURE, 240.0),
+    "tbsp": (MEASURE, 15.0),
+    "tablespoon": (MEASURE, 15.0),
+    "tsp": (MEASURE, 5.0),
+    "teaspoon": (MEASURE, 5.0),
+    "pint": (MEASURE, 473.0),
+    "quart": (MEASURE, 946.0),
+    "gallon": (MEASURE, 3785.0),
+    "dozen": (COUNT, 12.0),
+}
+
+NUMBER = r"(\d+(?:\.\d+)?(?:\s*/\s*\d+)?)"
+QUANTITY_PATTERN = re.compile(NUMBER + r"\s*(?:x\s*" + NUMBER + r")?\s*([a-zA-Z]+\.?(?:\s+oz)?)?")
+PER_WEIGHT_PATTERN = re.compile(r"\$(\d+(?:\.\d+)?)\s*/\s*(\d*(?:\.\d+)?)\s*(kg|lb|g)\b", re.I)
+PRICE_PATTERN = re.compile(r"\$(\d+(?:\.\d+)?)")
+# Containers holding an unknown number of pieces ("Organic Bananas, Bunch")
+MULTI_PIECE_PATTERN = re.compile(r"\b(bunch|bag|pack|package|box|tray|carton|case|net)\b", re.I)
+
+
+def parse_number(text: str) -> float:
+    if "/" in text:
+        numerator, denominator = text.split("/")
+        return float(numerator) / float(denominator)
+    return float(text)
+
+
+def parse_quantity(text: Any) -> Optional[Tuple[int, float]]:
+    """"1.5 lbs" -> (MEASURE, 680.4), "1 dozen" -> (COUNT, 12), "2 x 400g" -> (MEASURE, 800).
+
+    Unknown units ("3 cans", "1 loaf") count as pieces. Returns None without a number.
+    """
+    if isinstance(text, (int, float)):
+        return COUNT, float(text)
+    if not isinstance(text, str):
+        return None
+    match = QUANTITY_PATTERN.search(text.lower())
+    if match is None:
+        return None
+    amount = parse_number(match.group(1))
+    if match.group(2):
+        amount *= parse_number(match.group(2))
+    unit = (match.group(3) or "").rstrip(".").replace("fl oz", "oz").replace(" ", "")
+    dimension, factor = UNITS.get(unit, UNITS.get(unit.rstrip("s"), (COUNT, 1.0)))
+    return dimension, amount * factor
+
+
+def parse_price(text: Any) -> Optional[float]:
+    if isinstance(text, (int, float)):
+        return float(text)
+    match = PRICE_PATTERN.search(text) if isinstance(text, str) else None
+    return float(match.group(1)) if match else None
+
+
+def parse_package(candidate: Dict[str, Any]) -> Dict[str, float]:
+    """Shelf price, package size and (for products sold by weight) price per gram of a scraped product.
+
+    "multi_piece" is True for bunches, bags and packs whose piece count is
+    not given, so a counted quantity cannot be split into packages.
+    """
+    unit_size = candidate.get("unit_size") or ""
+    described = " ".join(
+        str(candidate.get(key) or "") for key in ("title", "prices", "unit_size")
+    )
+    package = {
+        "price": parse_price(candidate.get("prices")),
+        "dimension": COUNT,
+        "size": 1.0,
+        "per_gram": None,
+        "multi_piece": bool(MULTI_PIECE_PATTERN.search(described)),
+    }
+    per_weight = PER_WEIGHT_PATTERN.search(unit_size)
+    if per_weight:
+        # e.g. "$20.92/1kg $9.49/1lb": the shelf price is for a typical piece
+        amount = float(per_weight.group(2) or 1)
+        grams = amount * UNITS[per_weight.group(3).lower()][1]
+        package["per_gram"] = float(per_weight.group(1)) / grams
+        return package
+    size = parse_quantity(unit_size)
+    if size is not None and size[1] > 0:
+        package["dimension"], package["size"] = size
+        if size[0] == COUNT:
+            package["multi_piece"] = False
+    return package
+
+
+def price_matrix(
+    quantities: List[Any], candidates: List[List[Dict[str, Any]]]
+) -> Dict[str, np.ndarray]:
+    """Cost of buying each requested quantity from each candidate product.
+
+    Items are rows and candidates are columns (rows are padded with inf).
+    Matching dimensions buy whole packages: ceil(requested / package size).
+    Products sold by weight cost requested grams times the per-gram price.
+    A count against a measured package buys one package per piece, and a
+    measure against a counted package buys a single package, since there is
+    no way to convert between the two. A count against a bunch, bag or pack
+    of unknown size also buys a single package.
+    """
+    rows, cols = len(quantities), max((len(c) for c in candidates), default=0)
+    shape = (rows, max(cols, 1))
+    price = np.full(shape, np.nan)
+    size = np.ones(shape)
+    dimension = np.full(shape, -1)
+    per_gram = np.full(shape, np.nan)
+    multi_piece = np.zeros(shape, dtype=bool)
+    for i, row in enumerate(candidates):
+        for j, candidate in enumerate(row):
+            package = parse_package(candidate)
+            if package["price"] is not None:
+                price[i, j] = package["price"]
+            if package["per_gram"] is not None:
+                per_gram[i, j] = package["per_gram"]
+            dimension[i, j] = package["dimension"]
+            size[i, j] = package["size"]
+            multi_piece[i, j] = package["multi_piece"]
+
+    parsed = [parse_quantity(quantity) or (COUNT, 1.0) for quantity in quantities]
+    requested = np.array([amount for _, amount in parsed], dtype=float).reshape(-1, 1)
+    requested_dimension = np.array([dim for dim, _ in parsed]).reshape(-1, 1)
+
+    packages = np.where(
+        dimension == requested_dimension,
+        np.ceil(requested / size - 1e-9),
+        np.where(requested_dimension == COUNT, np.ceil(requested - 1e-9), 1.0),
+    )
+    packages = np.where(multi_piece & (requested_dimension == COUNT), 1.0, packages)
+    packages = np.maximum(packages, 1.0)
+    by_weight = ~np.isnan(per_gram) & (requested_dimension == MEASURE)
+    cost = np.where(by_weight, requested * per_gram, packages * price)
+    packages = np.where(by_weight, np.nan, packages)
+    cost = np.where(np.isnan(cost), np.inf, np.round(cost, 2))
+    return {"cost": cost, "packages": packages}
+
+
+def cart_total(cost: np.ndarray, choice: Optional[np.ndarray] = None) -> float:
+    """Sum of the chosen candidate per item (the first by default), skipping unpriced items"""
+    if cost.size == 0:
+        return 0.0
+    choice = np.zeros(cost.shape[0], dtype=int) if choice is None else choice
+    picked = cost[np.arange(cost.shape[0]), choice]
+    return round(float(picked[np.isfinite(picked)].sum()), 2)
+
+
+def finite_or_none(value: float) -> Optional[float]:
+    return float(value) if math.isfinite(value) else None
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from Agents.plan_cache import canonical_name, normalized_set
+
+RECIPE_CACHE_PATH = os.environ.get("RECIPE_CACHE_PATH", "recipe_cache.sqlite")
+RECIPE_CACHE_TTL = float(os.environ.get("RECIPE_CACHE_TTL", 14 * 24 * 3600))  # seconds
+# Newest recipes scanned per constraint set by the subset lookup
+RECIPE_CACHE_SCAN = 500
+
+# Allowed in every recipe without being on the grocery list (see RECIPE_SYSTEM_PROMPT)
+PANTRY_STAPLES = {
+    "water",
+    "salt",
+    "sea salt",
+    "pepper",
+    "black pepper",
+    "dried spices",
+    "spices",
+}
+
+
+def sha256(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def constraints_key(profile: Dict[str, Any], version: str = "") -> str:
+    """Hash of everything besides the ingredients that a recipe has to respect"""
+    return sha256(
+        {
+            "diet": normalized_set(profile.get("diet_preference")),
+            "allergies": normalized_set(profile.get("allergies")),
+            "medical_conditions": normalized_set(profile.get("medical_conditions")),
+            "goal": str(profile.get("goal", "")).strip().lower(),
+            "version": version,
+        }
+    )
+
+
+def ingredient_set(names: Iterable[str]) -> List[str]:
+    return sorted({canonical_name(name) for name in names} - {""})
+
+
+def recipe_uses(recipe: Dict[str, Any]) -> List[str]:
+    """Canonical names of the ingredients a recipe needs, pantry staples left out"""
+    return [
+        name
+        for name in ingredient_set(item.get("item", "") for item in recipe.get("ingredients", []))
+        if name not in PANTRY_STAPLES
+    ]
+
+
+# Words that describe a variety or cut without changing what the ingredient is:
+# "brown rice" can stand in for "rice", "peanut butter" cannot for "butter"
+DESCRIPTORS = {
+    "baby",
+    "basmati",
+    "boneless",
+    "breast",
+    "brown",
+    "crown",
+    "dried",
+    "extra",
+    "fat",
+    "fillet",
+    "floret",
+    "free",
+    "fresh",
+    "frozen",
+    "grain",
+    "greek",
+    "ground",
+    "jasmine",
+    "large",
+    "lean",
+    "long",
+    "low",
+    "medium",
+    "non",
+    "organic",
+    "plain",
+    "raw",
+    "reduced",
+    "rolled",
+    "skim",
+    "skinless",
+    "small",
+    "thigh",
+    "unsalted",
+    "white",
+    "whole",
+    "wild",
+}
+
+
+def singular(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def available(name: str, ingredients: List[str]) -> bool:
+    """"rice" is covered by "brown rice" and "chicken" by "chicken breast".
+
+    An available ingredient covers a recipe ingredient when it contains all of
+    its words in order and every other word is a DESCRIPTOR, so "butter" is
+    not covered by "peanut butter" nor "milk" by "coconut milk".
+    """
+    wanted = [singular(word) for word in name.replace("-", " ").split()]
+    for ingredient in ingredients:
+        words = [singular(word) for word in ingredient.replace("-", " ").split()]
+        for start in range(len(words) - len(wanted) + 1):
+            if words[start : start + len(wanted)] != wanted:
+                continue
+            extra = words[:start] + words[start + len(wanted) :]
+            if all(word in DESCRIPTORS for word in extra):
+                return True
+    return False
+
+
+class RecipeCache:
+    """Generated recipes indexed by constraint set and canonical ingredient set.
+
+    `lookup` first returns recipes stored for exactly the same ingredient set,
+    then any other recipe for the same constraints whose ingredients are all
+    in the available set, newest first and distinct by meal name.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = RECIPE_CACHE_PATH,
+        ttl: float = RECIPE_CACHE_TTL,
+        version: str = "",
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.version = version
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "recipes_served": 0, "recipes_stored": 0, "full_hits": 0}
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS recipe_cache ("
+                    "id INTEGER PRIMARY KEY, constraints TEXT NOT NULL, "
+                    "ingredients_key TEXT NOT NULL, uses TEXT NOT NULL, "
+                    "meal_name TEXT NOT NULL, recipe TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS recipe_cache_exact "
+                    "ON recipe_cache (constraints, ingredients_key)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS recipe_cache_recent "
+                    "ON recipe_cache (constraints, created_at)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def lookup(
+        self, profile: Dict[str, Any], ingredients: List[str], limit: int
+    ) -> List[Dict[str, Any]]:
+        """Up to `limit` stored recipes that can be made from `ingredients` under the profile's constraints"""
+        if not self.path or limit <= 0:
+            return []
+        constraints = constraints_key(profile, self.version)
+        names = ingredient_set(ingredients)
+        fresh_after = time.time() - self.ttl if self.ttl else 0
+        with self._connect() as conn:
+            exact = conn.execute(
+                "SELECT uses, meal_name, recipe FROM recipe_cache "
+                "WHERE constraints = ? AND ingredients_key = ? AND created_at >= ? "
+                "ORDER BY created_at DESC",
+                (constraints, sha256(names), fresh_after),
+            ).fetchall()
+            recent = conn.execute(
+                "SELECT uses, meal_name, recipe FROM recipe_cache "
+                "WHERE constraints = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (constraints, fresh_after, RECIPE_CACHE_SCAN),
+            ).fetchall()
+
+        recipes, meal_names = [], set()
+        for uses, meal_name, recipe in exact + recent:
+            if len(recipes) == limit:
+                break
+            if meal_name in meal_names:
+                continue
+            if all(available(name, names) for name in json.loads(uses)):
+                meal_names.add(meal_name)
+                recipes.append(json.loads(recipe))
+        self._count("lookups")
+        self._count("recipes_served", len(recipes))
+        if len(recipes) == limit:
+            self._count("full_hits")
+        return recipes
+
+    def put(self, profile: Dict[str, Any], ingredients: List[str], recipes: List[Dict[str, Any]]):
+        if not self.path or not recipes:
+            return
+        constraints = constraints_key(profile, self.version)
+        ingredients_key = sha256(ingredient_set(ingredients))
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO recipe_cache "
+                "(constraints, ingredients_key, uses, meal_name, recipe, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        constraints,
+                        ingredients_key,
+                        json.dumps(recipe_uses(recipe)),
+                        canonical_name(recipe.get("meal_name", "")),
+                        json.dumps(recipe),
+                        now,
+                    )
+                    for recipe in recipes
+                ],
+            )
+        self._count("recipes_stored", len(recipes))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+
+class SpeculativeRuns:
+    """Work started ahead of the decision that needs it, at most one task per run id.
+
+    `start(run_id, key, work)` runs work(cancelled) in the background, where
+    `cancelled` is a threading.Event the work should check between steps.
+    The consumer later calls `commit(run_id, key)`: if the task was started
+    for the same key its result is returned, otherwise it is cancelled and
+    None is returned so the caller does the work itself. `discard` cancels a
+    task whose result will never be needed.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._pool = ContextThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, tuple] = {}
+        self.stats = {"started": 0, "committed": 0, "discarded": 0, "failed": 0}
+
+    def start(self, run_id: str, key: Hashable, work: Callable[[threading.Event], Any]):
+        self.discard(run_id)
+        cancelled = threading.Event()
+        future = self._pool.submit(work, cancelled)
+        with self._lock:
+            self._tasks[run_id] = (key, future, cancelled)
+            self.stats["started"] += 1
+
+    def commit(self, run_id: str, key: Hashable, timeout: Optional[float] = None) -> Any:
+        """The speculative result for `key`, or None if there is none to use"""
+        with self._lock:
+            task = self._tasks.pop(run_id, None)
+        if task is None:
+            return None
+        task_key, future, cancelled = task
+        if task_key != key:
+            self._cancel(future, cancelled)
+            return None
+        try:
+            result = future.result(timeout=timeout)
+        except Exception as e:
+            print(f"Debug - Speculative work for {run_id} failed: {e}")
+            with self._lock:
+                self.stats["failed"] += 1
+            return None
+        with self._lock:
+            self.stats["committed"] += 1
+        return result
+
+    def discard(self, run_id: str):
+        with self._lock:
+            task = self._tasks.pop(run_id, None)
+        if task is not None:
+            self._cancel(task[1], task[2])
+
+    def _cancel(self, future: Future, cancelled: threading.Event):
+        cancelled.set()
+        future.cancel()
+        with self._lock:
+            self.stats["discarded"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["commit_rate"] = stats["committed"] / stats["started"] if stats["started"] else 0.0
+        return stats
@@ -0,0 +1,278 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Spans are only written to disk when WORKFLOW_TRACE_PATH is set. A file
+# larger than WORKFLOW_TRACE_MAX_BYTES is moved to <path>.1 before the next export.
+WORKFLOW_TRACE_PATH = os.environ.get("WORKFLOW_TRACE_PATH") or None
+WORKFLOW_TRACE_MAX_BYTES = int(os.environ.get("WORKFLOW_TRACE_MAX_BYTES", 50 * 1024 * 1024))
+
+# USD per million tokens (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+
+def llm_cost(
+    model: Optional[str],
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_prompt_tokens: int = 0,
+) -> float:
+    """Estimated USD cost of one completion; unknown models cost 0"""
+    for name, (input_price, cached_price, output_price) in sorted(
+        MODEL_PRICES.items(), key=lambda entry: -len(entry[0])
+    ):
+        if model and model.startswith(name):
+            return (
+                (prompt_tokens - cached_prompt_tokens) * input_price
+                + cached_prompt_tokens * cached_price
+                + completion_tokens * output_price
+            ) / 1e6
+    return 0.0
+
+
+# Metadata key naming the node of work started outside the graph, such as
+# speculative recipes, which would otherwise count toward the node that started it
+TRACE_NODE_KEY = "trace_node"
+
+# Runs export from several threads into the same file
+EXPORT_LOCK = threading.Lock()
+
+
+def rotate(path: str, max_bytes: int = WORKFLOW_TRACE_MAX_BYTES):
+    """Move a trace file past max_bytes to <path>.1, replacing the previous one"""
+    try:
+        if os.path.getsize(path) > max_bytes:
+            os.replace(path, f"{path}.1")
+    except FileNotFoundError:
+        pass
+
+
+class WorkflowTracer(BaseCallbackHandler):
+    """Record a span per graph node, LLM call and traced helper call of one workflow run.
+
+    Passed as a callback in the graph config, so it sees every run LangGraph
+    and LangChain start, whichever thread executes the node. Node runs are the
+    chains whose name matches their `langgraph_node` (or TRACE_NODE_KEY)
+    metadata; LLM and helper spans are attributed to the node that
+    (transitively) started them.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        traced_calls: tuple = (),
+        cache_hit: Callable[[], bool] = lambda: False,
+        iteration: int = 0,
+    ):
+        self.run_id = run_id
+        self.traced_calls = set(traced_calls)
+        self.cache_hit = cache_hit
+        self.spans: List[Dict[str, Any]] = []
+        self.iteration = iteration  # resumed runs continue from the checkpointed iteration
+        self.started_at = time.time()
+        self._open: Dict[UUID, Dict[str, Any]] = {}
+        self._node_of: Dict[UUID, Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], span: Dict[str, Any]):
+        node = self._node_of.get(parent_run_id)
+        span.update(
+            {
+                "run_id": self.run_id,
+                "node": node["name"] if node else span.get("node"),
+                "iteration": node["iteration"] if node else self.iteration,
+                "start": time.time(),
+                "_perf": time.perf_counter(),
+            }
+        )
+        self._open[run_id] = span
+
+    def _end(self, run_id: UUID, **attributes):
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            if span is None:
+                return
+            span["wall_ms"] = (time.perf_counter() - span.pop("_perf")) * 1000
+            span.update(attributes)
+            self.spans.append(span)
+
+    # Chains: graph nodes and traced helper calls
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        node_name = (metadata or {}).get(TRACE_NODE_KEY) or (metadata or {}).get("langgraph_node")
+        with self._lock:
+            if node_name is not None and name == node_name and not name.startswith("__"):
+                if isinstance(inputs, dict) and "iteration" in inputs:
+                    self.iteration = inputs["iteration"] or 0
+                if name == "grocery_list_generator":
+                    # Every pass through the list generator starts a new budget loop iteration
+                    self.iteration += 1
+                span = {"kind": "node", "name": name, "node": name}
+                self._start(run_id, None, span)
+                span["iteration"] = self.iteration
+                self._node_of[run_id] = span
+                return
+            self._node_of[run_id] = self._node_of.get(parent_run_id)
+            if name in self.traced_calls:
+                self._start(run_id, parent_run_id, {"kind": "tool", "name": name})
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id, status="ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, status="error", error=str(error))
+
+    # LLM calls
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, parent_run_id=None, **kwargs
+    ):
+        params = kwargs.get("invocation_params") or {}
+        with self._lock:
+            self._start(
+                run_id,
+                parent_run_id,
+                {
+                    "kind": "llm",
+                    "name": params.get("_type", "chat_model"),
+                    "model": params.get("model_name") or params.get("model"),
+                },
+            )
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self.on_chat_model_start(
+            serialized, prompts, run_id=run_id, parent_run_id=parent_run_id, **kwargs
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        llm_output = response.llm_output or {}
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        if usage:
+            prompt_tokens = usage.get("input_tokens", 0)
+            completion_tokens = usage.get("output_tokens", 0)
+            # Prompt tokens the provider served from its own prefix cache
+            cached_prompt_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        else:
+            token_usage = llm_output.get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+            cached_prompt_tokens = (token_usage.get("prompt_tokens_details") or {}).get(
+                "cached_tokens", 0
+            )
+
+        cache_hit = self.cache_hit()
+        with self._lock:
+            span = self._open.get(run_id, {})
+            model = llm_output.get("model_name") or span.get("model")
+        self._end(
+            run_id,
+            status="ok",
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_prompt_tokens=cached_prompt_tokens or 0,
+            cache_hit=cache_hit,
+            cost_usd=0.0
+            if cache_hit
+            else llm_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens or 0),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, status="error", error=str(error))
+
+    # LangChain tools
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            self._node_of[run_id] = self._node_of.get(parent_run_id)
+            self._start(
+                run_id,
+                parent_run_id,
+                {"kind": "tool", "name": (serialized or {}).get("name", "tool")},
+            )
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, status="ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, status="error", error=str(error))
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals for the run, broken down per node and per loop iteration"""
+        with self._lock:
+            spans = list(self.spans)
+
+        def totals():
+            return {
+                "wall_ms": 0.0,
+                "llm_calls": 0,
+                "prompt_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost_usd": 0.0,
+                "cache_hits": 0,
+                "llm_errors": 0,
+            }
+
+        run_totals = totals()
+        by_node = defaultdict(lambda: {**totals(), "count": 0, "tool_calls": 0})
+        by_iteration = defaultdict(totals)
+        for span in spans:
+            node = by_node[span.get("node") or "unattributed"]
+            iteration = by_iteration[span.get("iteration", 0)]
+            if span["kind"] == "node":
+                node["count"] += 1
+                node["wall_ms"] += span["wall_ms"]
+                iteration["wall_ms"] += span["wall_ms"]
+            elif span["kind"] == "tool":
+                node["tool_calls"] += 1
+            elif span["kind"] == "llm":
+                for bucket in (run_totals, node, iteration):
+                    bucket["llm_calls"] += 1
+                    bucket["prompt_tokens"] += span.get("prompt_tokens", 0)
+                    bucket["cached_prompt_tokens"] += span.get("cached_prompt_tokens", 0)
+                    bucket["completion_tokens"] += span.get("completion_tokens", 0)
+                    bucket["cost_usd"] += span.get("cost_usd", 0.0)
+                    bucket["cache_hits"] += int(span.get("cache_hit", False))
+                    bucket["llm_errors"] += int(span.get("status") == "error")
+
+        run_totals["wall_ms"] = (time.time() - self.started_at) * 1000
+        run_totals["prompt_cache_rate"] = (
+            run_totals["cached_prompt_tokens"] / run_totals["prompt_tokens"]
+            if run_totals["prompt_tokens"]
+            else 0.0
+        )
+        return {
+            "run_id": self.run_id,
+            **run_totals,
+            "by_node": dict(by_node),
+            "by_iteration": {str(key): value for key, value in sorted(by_iteration.items())},
+        }
+
+    def export(self, path: Optional[str] = WORKFLOW_TRACE_PATH) -> Dict[str, Any]:
+        """The run summary; with a path, every span and the summary are appended to it as JSON lines"""
+        summary = self.summary()
+        if path:
+            with self._lock:
+                spans = list(self.spans)
+            with EXPORT_LOCK:
+                rotate(path)
+                with open(path, "a") as f:
+                    for span in spans:
+                        f.write(json.dumps({"type": "span", **span}, default=str) + "\n")
+                    f.write(json.dumps({"type": "summary", **summary}, default=str) + "\n")
+        return summary
@@ -1,23 +1,77 @@
-from fastapi import APIRouter, Depends
-from Agents.master_agent import run_grocery_workflow
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo.errors import PyMongoError
+from Agents.master_agent import (
+    last_plan,
+    resume_grocery_workflow,
+    run_grocery_workflow,
+    stream_grocery_workflow,
+)
 from app.utils.jwt import get_current_user
-from fastapi.security import OAuth2PasswordBearer
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+import json
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+def format_sse(events):
+    """Serialize workflow progress events as server-sent events"""
+    for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
 @router.post("/reply", response_model=dict)
 async def get_nutrition_info(
     chat: dict,
     current_user: dict = Depends(get_current_user),
-    token: str = Depends(oauth2_scheme),
 ):
     try:
-        reply = run_grocery_workflow(current_user, token, chat["message"])
+        reply = run_grocery_workflow(current_user, chat["message"])
         if reply:
             return {"message": "Success", "reply": reply}
     except Exception as e:
         print(e)
         return {"message": "Fail"}
+
+
+@router.post("/stream")
+async def stream_meal_plan(
+    chat: dict,
+    current_user: dict = Depends(get_current_user),
+):
+    # The workflow is synchronous; StreamingResponse drains it in a threadpool
+    # and flushes each event as soon as the corresponding node completes
+    events = stream_grocery_workflow(current_user, chat["message"])
+    return StreamingResponse(
+        format_sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/resume/{run_id}")
+async def resume_meal_plan(
+    run_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    # Continues from the last checkpointed node; completed LLM calls and
+    # scrapes are not repeated
+    events = resume_grocery_workflow(run_id, str(current_user["_id"]))
+    return StreamingResponse(
+        format_sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/last-plan", response_model=dict)
+def get_last_plan(current_user: dict = Depends(get_current_user)):
+    # Served from the run artifact store, so any worker can answer without
+    # re-running the workflow; a plain def keeps the sync lookup off the event loop
+    try:
+        plan = last_plan(str(current_user["_id"]))
+    except PyMongoError as e:
+        print(e)
+        raise HTTPException(status_code=503, detail="Meal plan store unavailable")
+    if plan is None:
+        raise HTTPException(status_code=404, detail="No meal plan found")
+    return {"message": "Success", "plan": plan}
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import OperationFailure
+
+MONGO_URL = os.environ.get("MONGO_URL")
+# Run artifacts are deleted by Mongo this many seconds after their last write
+RUN_ARTIFACT_TTL = int(os.environ.get("RUN_ARTIFACT_TTL", 30 * 24 * 3600))
+RUN_ARTIFACT_DIR = os.environ.get("RUN_ARTIFACT_DIR", ".")
+# Mongo error code for create_index on an existing index with other options
+INDEX_OPTIONS_CONFLICT = 85
+
+_client = None
+
+
+def get_db():
+    """Synchronous client for code running outside the event loop (the agent graph runs in a worker thread)"""
+    global _client
+    if _client is None:
+        _client = MongoClient(MONGO_URL)
+    return _client["strawhats"]
+
+
+def next_week(db, user_id: ObjectId) -> int:
+    latest = db["grocery_list"].find_one(
+        {"user_id": user_id}, sort=[("week", -1)], projection={"week": 1}
+    )
+    return (latest or {}).get("week", 0) + 1
+
+
+def save_meal_plan(
+    user_id: str, recipes: List[Dict[str, Any]], groceries: List[Dict[str, Any]]
+) -> int:
+    """Store a week's meals with one insert_many and its grocery list with one insert.
+
+    Both are stamped with the same week number: the week after the user's latest
+    grocery list. Returns that week.
+    """
+    db = get_db()
+    user_id = ObjectId(user_id)
+    week = next_week(db, user_id)
+    if recipes:
+        db["meals"].insert_many(
+            [{**recipe, "user_id": user_id, "week": week} for recipe in recipes],
+            ordered=False,
+        )
+    db["grocery_list"].insert_one(
+        {"groceries": groceries, "user_id": user_id, "week": week}
+    )
+    return week
+
+
+class MongoArtifactStore:
+    """Per-run workflow artifacts (grocery list, prices, recipes) in the run_artifacts collection.
+
+    One document per (run_id, name), upserted on every write. Lookups by run
+    and by user are indexed, and a TTL index on updated_at expires old runs.
+    """
+
+    def __init__(self, ttl: int = RUN_ARTIFACT_TTL):
+        self.ttl = ttl
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def collection(self):
+        collection = get_db()["run_artifacts"]
+        with self._lock:
+            if not self._indexed:
+                collection.create_index([("run_id", ASCENDING), ("name", ASCENDING)], unique=True)
+                collection.create_index(
+                    [("user_id", ASCENDING), ("name", ASCENDING), ("updated_at", DESCENDING)]
+                )
+                self._ensure_ttl(collection)
+                self._indexed = True
+        return collection
+
+    def _ensure_ttl(self, collection):
+        try:
+            collection.create_index("updated_at", expireAfterSeconds=self.ttl)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            # RUN_ARTIFACT_TTL changed since the index was built: update it in place
+            collection.database.command(
+                "collMod",
+                collection.name,
+                index={"keyPattern": {"updated_at": 1}, "expireAfterSeconds": self.ttl},
+            )
+
+    def write(self, run_id: str, user_id: Optional[str], name: str, content: Dict[str, Any]):
+        self.collection().replace_one(
+            {"run_id": run_id, "name": name},
+            {
+                "run_id": run_id,
+                "user_id": user_id,
+                "name": name,
+                "content": content,
+                "updated_at": datetime.now(timezone.utc),
+            },
+            upsert=True,
+        )
+
+    def read(self, run_id: str, name: str) -> Optional[Dict[str, Any]]:
+        document = self.collection().find_one(
+            {"run_id": run_id, "name": name}, projection={"content": 1}
+        )
+        return document["content"] if document else None
+
+    def last_plan(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Artifacts of the user's latest run that got as far as recipes"""
+        collection = self.collection()
+        latest = collection.find_one(
+            {"user_id": user_id, "name": "recipes"}, sort=[("updated_at", DESCENDING)]
+        )
+        if latest is None:
+            return None
+        plan = {"run_id": latest["run_id"], "updated_at": latest["updated_at"]}
+        for document in collection.find({"run_id": latest["run_id"]}):
+            plan[document["name"]] = document["content"]
+        return plan
+
+    def end_run(self, run_id: str):
+        pass
+
+
+class FileArtifactStore:
+    """The artifact store used without MONGO_URL: JSON files in one directory.
+
+    The latest artifact of each kind is written to the file name the workflow
+    has always used, and a run that reaches recipes is also snapshotted to
+    last_plans/<user_id>.json for last_plan. Only suitable for a single worker.
+    """
+
+    FILENAMES = {
+        "grocery_list": "agent1_output.json",
+        "prices": "item_prices.json",
+        "recipes": "meals.json",
+    }
+
+    def __init__(self, directory: str = RUN_ARTIFACT_DIR):
+        self.directory = directory
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, self.FILENAMES.get(name, f"{name}.json"))
+
+    def write(self, run_id: str, user_id: Optional[str], name: str, content: Dict[str, Any]):
+        with open(self.path(name), "w") as f:
+            json.dump(content, f, indent=2)
+        with self._lock:
+            run = self._runs.setdefault(run_id, {})
+            run[name] = content
+            if name != "recipes":
+                return
+            self._runs.pop(run_id)
+        if user_id:
+            os.makedirs(os.path.join(self.directory, "last_plans"), exist_ok=True)
+            plan = {
+                "run_id": run_id,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                **run,
+            }
+            with open(os.path.join(self.directory, "last_plans", f"{user_id}.json"), "w") as f:
+                json.dump(plan, f, indent=2)
+
+    def read(self, run_id: str, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            content = self._runs.get(run_id, {}).get(name)
+        if content is not None:
+            return content
+        try:
+            with open(self.path(name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def end_run(self, run_id: str):
+        """Drop the in-memory artifacts of a run that stopped before recipes"""
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def last_plan(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, "last_plans", f"{user_id}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+
+def get_artifact_store():
+    """Mongo when MONGO_URL is set, so any worker can read any run; files otherwise"""
+    return MongoArtifactStore() if MONGO_URL else FileArtifactStore()
@@ -0,0 +1,154 @@
+"""Compare plans per minute of the full workflow on the hosted and local LLM backends.
+
+Unlike bench_workflow, the chat models are real: each backend in --backends
+is selected with master_agent.configure_backend and answers every LLM call
+of the run. Scraping still uses the recorded prices in benchmarks/fixtures,
+so the numbers measure the LLM backends and not the grocery site. Plans use
+slightly different profiles, and the plan and recipe caches are off. Each
+backend starts with an empty LLM cache. A plan only counts toward
+plans per minute if it ends with recipes and none of its LLM requests
+errored, retried ones included.
+
+The hosted backend needs OPENAI_API_KEY. The local backend needs an
+OpenAI-compatible server at LOCAL_LLM_BASE_URL (default Ollama:
+`ollama serve` with OLLAMA_NUM_PARALLEL matching LOCAL_LLM_SLOTS).
+
+Run from the repository root:
+    python -m benchmarks.bench_backends --plans 8 --concurrency 4 --backends hosted local
+"""
+
+import argparse
+import contextlib
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+# bench_workflow sets a dummy OPENAI_API_KEY for its offline runs; remember
+# whether a real one was given before importing it
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+from benchmarks.bench_workflow import (
+    PROFILE,
+    WORKDIR,
+    FixturePriceProvider,
+    master_agent,
+    percentile,
+)
+
+
+def run_plan(index: int, budget: float) -> Dict[str, Any]:
+    """One plan; it only counts as done if it ends with recipes and no LLM request errored"""
+    profile = {**PROFILE, "weight": PROFILE["weight"] + index}
+    user_message = f"Plan my week for ${budget}"
+    start = time.perf_counter()
+    error = "workflow produced no workflow_complete event"
+    try:
+        for event in master_agent.stream_grocery_workflow(profile, user_message):
+            if event["event"] == "error":
+                error = event["detail"]
+            elif event["event"] == "workflow_complete":
+                llm_errors = event["trace"]["llm_errors"]
+                if llm_errors:
+                    error = f"{llm_errors} LLM requests errored"
+                elif not event["recipe_count"]:
+                    error = "no recipes"
+                else:
+                    error = None
+    except Exception as e:
+        error = str(e)
+    return {"latency_s": time.perf_counter() - start, "error": error}
+
+
+def failed_calls(metrics: Dict[str, Any]) -> int:
+    """LLM calls that failed after every retry, over all keys of llm_client.metrics()"""
+    return sum(
+        stats.get("failed_calls", 0)
+        for key, stats in metrics.items()
+        if key != "micro_batching"
+    )
+
+
+def run_backend(name: str, args, output) -> Dict[str, Any]:
+    # Every chat model shares llm_cache; emptying it keeps a backend from
+    # answering with completions cached by an earlier leg
+    master_agent.llm_cache.clear()
+    master_agent.configure_backend(name)
+    failed_before = failed_calls(master_agent.llm_client.metrics())
+    start = time.perf_counter()
+    with output, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(
+            pool.map(lambda index: run_plan(index, args.budget), range(args.plans))
+        )
+    wall_s = time.perf_counter() - start
+    done = [result["latency_s"] for result in results if result["error"] is None]
+    return {
+        "backend": name,
+        "models": master_agent.backend.tiers,
+        "wall_s": wall_s,
+        "plans_per_min": len(done) / wall_s * 60,
+        "p50_s": percentile(done, 50) if done else None,
+        "p95_s": percentile(done, 95) if done else None,
+        "mean_s": statistics.mean(result["latency_s"] for result in results),
+        "failed_plans": sum(1 for result in results if result["error"]),
+        "errors": sorted({result["error"] for result in results if result["error"]}),
+        "failed_llm_calls": failed_calls(master_agent.llm_client.metrics()) - failed_before,
+        "llm_client": master_agent.llm_client.metrics(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--backends", nargs="+", default=["hosted", "local"])
+    parser.add_argument("--budget", type=float, default=130.0)
+    parser.add_argument(
+        "--scrape-latency", type=float, default=0.0, help="seconds per price lookup"
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    if "hosted" in args.backends and not OPENAI_API_KEY:
+        parser.error("the hosted backend needs OPENAI_API_KEY")
+
+    prices = FixturePriceProvider(args.scrape_latency)
+    master_agent.PLAN_CACHE = False
+    master_agent.RECIPE_CACHE = False
+    master_agent.open_price_session = prices.open_session
+    master_agent.load_ingredients_data = prices.load_ingredients_data
+    master_agent.persist_meal_plan = lambda profile, recipes, prices_data: None
+    os.chdir(WORKDIR)
+
+    reports = []
+    for name in args.backends:
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(None)
+        reports.append(run_backend(name, args, output))
+
+    print(f"plans: {args.plans}  concurrency: {args.concurrency}")
+    print(
+        f"{'backend':10}{'plans/min':>11}{'p50 (s)':>10}{'p95 (s)':>10}"
+        f"{'failed':>8}{'LLM fails':>11}"
+    )
+    for report in reports:
+        p50 = f"{report['p50_s']:.2f}" if report["p50_s"] is not None else "-"
+        p95 = f"{report['p95_s']:.2f}" if report["p95_s"] is not None else "-"
+        print(
+            f"{report['backend']:10}{report['plans_per_min']:>11.2f}{p50:>10}{p95:>10}"
+            f"{report['failed_plans']:>8}{report['failed_llm_calls']:>11}"
+        )
+    for report in reports:
+        print(f"\n{report['backend']}: {report['models']}")
+        batching = report["llm_client"].get("micro_batching")
+        if batching:
+            print(
+                f"  micro-batching: {batching['requests']} requests, {batching['joined']} joined "
+                f"in flight, {batching['batches']} batches (mean {batching['mean_batch']:.1f}, "
+                f"largest {batching['largest_batch']})"
+            )
+        for error in report["errors"]:
+            print(f"  error: {error[:200]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Compare the old ReAct price checker with the direct price_checker node.
+
+Scraping is replaced by the recorded results in benchmarks/fixtures, so the
+difference between the two paths is the LLM overhead alone. The legacy path
+needs OPENAI_API_KEY; the LLM response cache is disabled for it. The direct
+path makes no LLM calls, so --skip-legacy runs offline without a key.
+
+Run from the repository root:
+    python -m benchmarks.bench_price_checker --iterations 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI
+from langgraph.prebuilt import create_react_agent
+
+# master_agent prompts for a key on import when none is set; the dummy keeps
+# the offline run from blocking, and the real key is checked for the legacy path
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import Agents.master_agent as master_agent
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Count chat/LLM invocations made while a runnable executes"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r") as f:
+        return json.load(f)
+
+
+def fixture_price_lookup(item_names):
+    """Serve scraped products from the fixture instead of driving a browser"""
+    scraped = load_fixture("scraped_prices.json")
+    wanted = {name.lower() for name in item_names}
+    return {
+        "ingredients": [
+            item for item in scraped["ingredients"] if item["name"].lower() in wanted
+        ]
+    }
+
+
+def measure(runnable, state, iterations):
+    latencies = []
+    calls = []
+    for _ in range(iterations):
+        counter = LLMCallCounter()
+        start = time.perf_counter()
+        runnable.invoke(state, config={"callbacks": [counter]})
+        latencies.append(time.perf_counter() - start)
+        calls.append(counter.calls)
+    return {
+        "mean_s": statistics.mean(latencies),
+        "p50_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "llm_calls": statistics.mean(calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+    if not args.skip_legacy and not OPENAI_API_KEY:
+        parser.error("the legacy path needs OPENAI_API_KEY; set it or pass --skip-legacy")
+
+    grocery_list = load_fixture("grocery_list.json")
+    master_agent.load_ingredients_data = fixture_price_lookup
+
+    # Keep the agent1_output.json / item_prices.json artifacts out of the repo
+    os.chdir(tempfile.mkdtemp(prefix="bench_price_checker_"))
+    with open("agent1_output.json", "w") as f:
+        json.dump(grocery_list, f, indent=2)
+
+    state = {
+        "messages": [
+            HumanMessage(content=json.dumps(grocery_list), name="grocery_list_generator")
+        ]
+    }
+
+    results = {
+        "direct": measure(
+            RunnableLambda(master_agent.price_checker_node), state, args.iterations
+        )
+    }
+    if not args.skip_legacy:
+        legacy_agent = create_react_agent(
+            ChatOpenAI(model=master_agent.llm.model_name, temperature=0, cache=False),
+            tools=[master_agent.find_cheapest],
+            state_modifier="You check prices and suggest substitutions if over budget.",
+        )
+        results["legacy_react"] = measure(legacy_agent, state, args.iterations)
+
+    print(f"{'path':<14}{'mean (s)':>10}{'p50 (s)':>10}{'max (s)':>10}{'LLM calls':>11}")
+    for path, result in results.items():
+        print(
+            f"{path:<14}{result['mean_s']:>10.3f}{result['p50_s']:>10.3f}"
+            f"{result['max_s']:>10.3f}{result['llm_calls']:>11.1f}"
+        )
+    if "legacy_react" in results:
+        legacy, direct = results["legacy_react"], results["direct"]
+        print(
+            f"\nPer price-check iteration: {legacy['llm_calls'] - direct['llm_calls']:.1f} "
+            f"LLM calls and {legacy['mean_s'] - direct['mean_s']:.3f}s removed"
+        )
+
+
+if __name__ == "__main__":
+    main()
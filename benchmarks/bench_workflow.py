@@ -0,0 +1,408 @@
+"""Run the full grocery workflow offline and report throughput and latency percentiles.
+
+run_grocery_workflow is driven end to end through the real graph, with the
+chat model replaced by a scripted model answering from benchmarks/fixtures
+and scraping replaced by the recorded prices in the same directory. Each
+call and each price lookup waits a configurable latency so the numbers
+reflect where the graph spends time. Opening a network connection fails
+the benchmark.
+
+Run from the repository root:
+    python -m benchmarks.bench_workflow --plans 20 --concurrency 4
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+# Keep every artifact of the run (LLM cache, checkpoints, traces, JSON files) out of the repo
+WORKDIR = tempfile.mkdtemp(prefix="bench_workflow_")
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(WORKDIR, "llm_cache.sqlite"))
+os.environ.setdefault(
+    "WORKFLOW_CHECKPOINT_DB", os.path.join(WORKDIR, "workflow_checkpoints.sqlite")
+)
+os.environ.setdefault("PLAN_CACHE_PATH", os.path.join(WORKDIR, "plan_cache.sqlite"))
+os.environ.setdefault("RECIPE_CACHE_PATH", os.path.join(WORKDIR, "recipe_cache.sqlite"))
+os.environ.setdefault("WORKFLOW_TRACE_PATH", os.path.join(WORKDIR, "workflow_traces.jsonl"))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import Agents.master_agent as master_agent
+from Agents.batch_planner import plan_batch
+from Agents.model_router import ModelRouter
+from Agents.plan_cache import PlanCache
+from Agents.recipe_cache import RecipeCache
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PROFILE = {
+    "age": 30,
+    "sex": "male",
+    "height": 180,
+    "weight": 80,
+    "diet_preference": ["Omnivore"],
+    "allergies": ["None"],
+    "activity_level": "moderate",
+    "goal": "weight_loss",
+    "medical_conditions": ["None"],
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r") as f:
+        return json.load(f)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+SEEN_PREFIXES = set()
+PREFIX_LOCK = threading.Lock()
+# OpenAI caches prompt prefixes of at least 1024 tokens, in steps of 128 tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+
+
+def cacheable_tokens(prefix_tokens: int) -> int:
+    """Tokens of a repeated prefix the provider would serve from its prompt cache"""
+    if prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+        return 0
+    steps = (prefix_tokens - PROMPT_CACHE_MIN_TOKENS) // PROMPT_CACHE_INCREMENT
+    return PROMPT_CACHE_MIN_TOKENS + steps * PROMPT_CACHE_INCREMENT
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model answering every structured call from a fixture, after a fixed latency.
+
+    Structured output calls are recognised by the bound tool (the schema name).
+    A response may be a callable taking the messages, for prompt-dependent
+    answers. Calls with a response_format (the streamed grocery list) get the
+    `json_mode_schema` response, streamed in `stream_chunks` pieces so
+    incremental parsing is exercised.
+    """
+
+    responses: Dict[str, Any]
+    json_mode_schema: str = "GroceryList"
+    latency: float = 0.0
+    stream_chunks: int = 8
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(t, "__name__", None) or getattr(t, "name", str(t)) for t in tools]
+        kwargs.pop("ls_structured_output_format", None)
+        return self.bind(tools=names, **kwargs)
+
+    def _response(self, name, messages):
+        response = self.responses[name]
+        return response(messages) if callable(response) else response
+
+    def _respond(self, messages, kwargs) -> AIMessage:
+        tools = kwargs.get("tools") or []
+        for name in tools:
+            if name in self.responses:
+                args = self._response(name, messages)
+                return AIMessage(
+                    content="", tool_calls=[{"name": name, "args": args, "id": "call_0"}]
+                )
+        if kwargs.get("response_format"):
+            return AIMessage(
+                content=json.dumps(self._response(self.json_mode_schema, messages))
+            )
+        raise ValueError(f"No scripted response for tools {tools}")
+
+    def _usage(self, messages, output: str) -> Dict[str, Any]:
+        prompt_tokens = estimate_tokens("".join(str(m.content) for m in messages))
+        completion_tokens = estimate_tokens(output)
+        # Mimic a provider prompt cache: a system prefix seen before is served
+        # from cache, subject to the provider's minimum length and increments
+        prefix = str(messages[0].content) if messages[0].type == "system" else ""
+        with PREFIX_LOCK:
+            cache_read = (
+                cacheable_tokens(estimate_tokens(prefix)) if prefix in SEEN_PREFIXES else 0
+            )
+            SEEN_PREFIXES.add(prefix)
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "input_token_details": {"cache_read": cache_read},
+        }
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        message = self._respond(messages, kwargs)
+        output = message.content or json.dumps(message.tool_calls)
+        message.usage_metadata = self._usage(messages, output)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._respond(messages, kwargs).content
+        size = max(1, -(-len(content) // self.stream_chunks))
+        for start in range(0, len(content), size):
+            time.sleep(self.latency / self.stream_chunks)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=content[start : start + size]))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(messages, content))
+        )
+
+
+def fixture_recipes(recipes: Dict[str, Any]):
+    """Answer per-day recipe requests with that day's fixture recipe, anything else with all of them"""
+
+    def respond(messages):
+        match = re.search(r"for day (\d+)", str(messages[-1].content))
+        if match is None:
+            return recipes
+        day = int(match.group(1))
+        return {"recipes": [recipes["recipes"][(day - 1) % len(recipes["recipes"])]]}
+
+    return respond
+
+
+class FixturePriceProvider:
+    """Serve scraped products from the fixture through the scraping session interface"""
+
+    def __init__(self, latency: float = 0.0):
+        self.products = {
+            item["name"].lower(): item
+            for item in load_fixture("scraped_prices.json")["ingredients"]
+        }
+        self.latency = latency
+        self.searches = 0
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def open_session(self):
+        with self._lock:
+            self.sessions += 1
+
+        def search(name):
+            time.sleep(self.latency)
+            with self._lock:
+                self.searches += 1
+            return self.products.get(name.lower())
+
+        yield search
+
+    def load_ingredients_data(self, item_names):
+        with self.open_session() as search:
+            return {"ingredients": [product for product in map(search, item_names) if product]}
+
+
+def forbid_network():
+    def refuse(*args, **kwargs):
+        raise RuntimeError("bench_workflow must not open network connections")
+
+    socket.create_connection = refuse
+    socket.socket.connect = refuse
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def run_plan(budget: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        master_agent.run_grocery_workflow(PROFILE, f"Plan my week for ${budget}")
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {"latency_s": time.perf_counter() - start, "error": error}
+
+
+def fresh_caches(label: str):
+    """Point the workflow at empty plan and recipe caches, so one leg cannot warm the other"""
+    master_agent.plan_cache = PlanCache(path=os.path.join(WORKDIR, f"plan_cache_{label}.sqlite"))
+    master_agent.recipe_cache = RecipeCache(
+        path=os.path.join(WORKDIR, f"recipe_cache_{label}.sqlite"),
+        version=master_agent.PROMPT_VERSION,
+    )
+
+
+def run_batch(args, budget: float, prices: FixturePriceProvider, output):
+    """Compare the batch planner with planning the same requests one after another.
+
+    The sequential leg runs first and each leg starts with empty caches.
+    """
+    requests = [
+        # Vary the weight so the plans fall in different plan cache buckets
+        ({**PROFILE, "weight": PROFILE["weight"] + 5 * index}, f"Plan my week for ${budget}")
+        for index in range(args.plans)
+    ]
+    fresh_caches("sequential")
+    start = time.perf_counter()
+    with output:
+        errors = 0
+        for profile, user_message in requests:
+            try:
+                master_agent.run_grocery_workflow(profile, user_message)
+            except Exception:
+                errors += 1
+    sequential_s = time.perf_counter() - start
+
+    fresh_caches("batch")
+    sequential_searches = prices.searches
+    with output:
+        batch = plan_batch(requests)
+    report = batch["report"]
+    batch_searches = prices.searches - sequential_searches
+
+    failed = [plan for plan in batch["plans"] if plan["event"] != "workflow_complete"]
+    print(f"plans: {report['plans']}  batch errors: {len(failed)}  sequential errors: {errors}")
+    print(
+        f"lookups: {report['item_lookups']} requested, {report['unique_lookups']} unique "
+        f"(dedup ratio {report['dedup_ratio']:.1f}), {batch_searches} scraped by the batch"
+    )
+    print(
+        f"batch wall: {report['wall_s']:.2f}s (lists {report['list_generation_s']:.2f}s, "
+        f"pricing {report['pricing_s']:.2f}s, resolution {report['resolution_s']:.2f}s)"
+    )
+    print(
+        f"sequential: {sequential_s:.2f}s measured; speedup {sequential_s / report['wall_s']:.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per LLM call")
+    parser.add_argument(
+        "--scrape-latency", type=float, default=0.2, help="seconds per price lookup"
+    )
+    # The fixture list costs about $122 with quantities priced; the default keeps
+    # plans on the direct path, a lower budget exercises the optimizer loop
+    parser.add_argument("--budget", type=float, default=130.0)
+    parser.add_argument(
+        "--no-plan-cache",
+        action="store_true",
+        help="generate every list (all plans share one profile, so they hit the plan cache)",
+    )
+    parser.add_argument(
+        "--no-recipe-cache",
+        action="store_true",
+        help="generate every recipe (the fixture recipes fit the fixture list, so they are cached)",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="plan all requests one after another, then with the batch planner for comparison",
+    )
+    parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="write recipes while each list is priced (SPECULATIVE_RECIPES=1)",
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    grocery_list = load_fixture("grocery_list.json")
+    budget = args.budget
+    prices = FixturePriceProvider(args.scrape_latency)
+    model = ScriptedChatModel(
+        responses={
+            "GroceryList": {**grocery_list, "budget": budget},
+            "RecipeSet": fixture_recipes(load_fixture("recipes.json")),
+        },
+        latency=args.llm_latency,
+    )
+
+    forbid_network()
+    master_agent.model_router = ModelRouter(lambda model_name, timeout: model)
+    master_agent.PLAN_CACHE = not args.no_plan_cache
+    master_agent.RECIPE_CACHE = not args.no_recipe_cache
+    master_agent.SPECULATIVE_RECIPES = args.speculative
+    master_agent.open_price_session = prices.open_session
+    master_agent.load_ingredients_data = prices.load_ingredients_data
+    master_agent.persist_meal_plan = lambda profile, recipes, prices_data: None
+    os.chdir(WORKDIR)
+
+    # The workflow prints a lot of debug output; silence it unless --verbose
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(None)
+    if args.batch:
+        run_batch(args, budget, prices, output)
+        return
+
+    start = time.perf_counter()
+    with output, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(run_plan, [budget] * args.plans))
+    wall_s = time.perf_counter() - start
+
+    latencies = [result["latency_s"] for result in results if result["error"] is None]
+    errors = [result["error"] for result in results if result["error"] is not None]
+    print(f"plans: {args.plans}  concurrency: {args.concurrency}  wall: {wall_s:.2f}s")
+    print(f"throughput: {len(latencies) / wall_s:.2f} plans/s  errors: {len(errors)}")
+    if latencies:
+        print(
+            f"latency (s): mean {statistics.mean(latencies):.3f}  "
+            f"p50 {percentile(latencies, 50):.3f}  p95 {percentile(latencies, 95):.3f}  "
+            f"p99 {percentile(latencies, 99):.3f}  max {max(latencies):.3f}"
+        )
+    print(
+        f"price lookups: {prices.searches} in {prices.sessions} sessions "
+        f"({prices.searches / args.plans:.1f} per plan)"
+    )
+    records = [json.loads(line) for line in open(os.environ["WORKFLOW_TRACE_PATH"])]
+    summaries = [record for record in records if record["type"] == "summary"]
+    # Grocery list prompts per iteration, comparable across budget loop trips
+    # (iteration totals also include the recipe calls of the last iteration)
+    list_prompts = {}
+    for record in records:
+        if (
+            record["type"] == "span"
+            and record["kind"] == "llm"
+            and record.get("node") == "grocery_list_generator"
+        ):
+            list_prompts.setdefault(record.get("iteration", 0), []).append(
+                record.get("prompt_tokens", 0)
+            )
+    prompt_tokens = sum(summary["prompt_tokens"] for summary in summaries)
+    cached_tokens = sum(summary["cached_prompt_tokens"] for summary in summaries)
+    print(
+        f"prompt tokens: {prompt_tokens / args.plans:.0f} per plan, "
+        f"{cached_tokens / max(prompt_tokens, 1):.0%} from the provider prompt cache"
+    )
+    iterations = {}
+    for summary in summaries:
+        for iteration, totals in summary["by_iteration"].items():
+            iterations.setdefault(int(iteration), []).append(totals)
+    for iteration, totals in sorted(iterations.items()):
+        if iteration == 0:
+            continue
+        list_prompt = (
+            f"{statistics.mean(list_prompts[iteration]):.0f}" if iteration in list_prompts else "-"
+        )
+        print(
+            f"iteration {iteration}: {len(totals)} plans, "
+            f"{statistics.mean(t['prompt_tokens'] for t in totals):.0f} prompt tokens "
+            f"({list_prompt} per grocery list call), "
+            f"{statistics.mean(t['wall_ms'] for t in totals):.0f} ms"
+        )
+    print(f"traces: {os.environ['WORKFLOW_TRACE_PATH']}")
+    for error in sorted(set(errors)):
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import pytest
+
+from app.schemas.user import User
+
+
+@pytest.fixture
+def profile():
+    """Build a profile dict as stored for a signed-up user; keyword arguments override fields"""
+
+    def build(**fields):
+        user = {
+            "username": "tester",
+            "email": "tester@example.com",
+            "password": "secret1",
+            "age": 30,
+            "sex": "Female",
+            "height": 170,
+            "weight": 65,
+            "diet_preference": ["Omnivore"],
+            "allergies": "None",
+            "activity_level": "Moderately Active",
+            "goal": "Weight Loss",
+            "medical_conditions": "None",
+        }
+        user.update(fields)
+        return User(**user).model_dump(exclude={"password"})
+
+    return build
@@ -0,0 +1,68 @@
+from Agents.budget_optimizer import candidate_cost, item_options, optimize_cart
+
+
+def item(name, total_price, alternatives=()):
+    return {
+        "name": name,
+        "title": f"{name} (brand)",
+        "total_price": total_price,
+        "alternatives": [
+            {"title": f"{name} ({label})", "total_price": price} for label, price in alternatives
+        ],
+    }
+
+
+def test_candidate_cost_prefers_total_price_over_shelf_price():
+    assert candidate_cost({"total_price": 7.5, "prices": "$2.00"}) == 7.5
+    assert candidate_cost({"prices": "$2.49 ea"}) == 2.49
+    assert candidate_cost({"total_price": None, "prices": "$2.00"}) is None
+    assert candidate_cost({"prices": "N/A"}) is None
+
+
+def test_item_options_skip_duplicate_and_unpriced_alternatives():
+    milk = item("Milk", 5.0, [("store", 4.0), ("store", 4.0), ("brand", 5.0)])
+    milk["alternatives"].append({"title": "Milk (unpriced)", "prices": "N/A"})
+    assert [option["cost"] for option in item_options(milk)] == [5.0, 4.0]
+
+
+def test_cart_under_budget_keeps_original_picks():
+    items = [item("Rice", 6.0, [("store", 4.0)]), item("Eggs", 5.0, [("store", 3.0)])]
+    result = optimize_cart(items, budget_cap=20.0)
+    assert result["swaps"] == []
+    assert result["total_price"] == 11.0
+    assert result["items"] == items
+
+
+def test_fewest_swaps_that_fit_the_budget():
+    items = [
+        item("Rice", 6.0, [("store", 4.0)]),
+        item("Chicken", 15.0, [("store", 9.0)]),
+        item("Eggs", 5.0, [("store", 3.0)]),
+    ]
+    # Swapping the chicken alone saves 6, which is enough
+    result = optimize_cart(items, budget_cap=20.0)
+    assert [swap["name"] for swap in result["swaps"]] == ["Chicken"]
+    assert result["swaps"][0]["saving"] == 6.0
+    assert result["total_price"] == 20.0
+    assert result["items"][1]["title"] == "Chicken (store)"
+    assert result["items"][1]["total_price"] == 9.0
+
+
+def test_ties_go_to_the_more_expensive_cart():
+    items = [item("Rice", 6.0, [("store", 4.0)]), item("Eggs", 6.0, [("store", 5.0)])]
+    # Either single swap fits; swapping the eggs keeps the cart closer to the list
+    result = optimize_cart(items, budget_cap=11.0)
+    assert [swap["name"] for swap in result["swaps"]] == ["Eggs"]
+    assert result["total_price"] == 11.0
+
+
+def test_unpriced_items_are_kept_and_cost_nothing():
+    items = [item("Rice", 6.0), {"name": "Salt", "title": "Salt", "prices": "N/A"}]
+    result = optimize_cart(items, budget_cap=6.0)
+    assert result["total_price"] == 6.0
+    assert result["items"][1]["name"] == "Salt"
+
+
+def test_returns_none_when_cheapest_cart_is_over_budget():
+    items = [item("Rice", 6.0, [("store", 4.0)]), item("Eggs", 5.0, [("store", 3.0)])]
+    assert optimize_cart(items, budget_cap=6.99) is None
@@ -0,0 +1,118 @@
+import contextvars
+import json
+import sqlite3
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from pydantic import BaseModel
+
+from Agents import llm_cache as llm_cache_module
+from Agents.llm_cache import LLMCache, cache_key
+
+
+def generations(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+def texts(value):
+    return [generation.message.content for generation in value]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(path=str(tmp_path / "llm_cache.sqlite"))
+
+
+def test_hit_needs_the_same_prompt_and_model(cache):
+    cache.update("prompt", "gpt-4o-mini", generations("answer"))
+    assert texts(cache.lookup("prompt", "gpt-4o-mini")) == ["answer"]
+    assert cache.lookup("prompt", "gpt-4o") is None
+    assert cache.lookup("other prompt", "gpt-4o-mini") is None
+    assert cache.metrics()["memory_hits"] == 1
+    assert cache.metrics()["misses"] == 2
+
+
+def test_disk_tier_serves_a_new_process(cache):
+    cache.update("prompt", "model", generations("answer"))
+    reopened = LLMCache(path=cache.path)
+    assert texts(reopened.lookup("prompt", "model")) == ["answer"]
+    assert reopened.metrics()["disk_hits"] == 1
+    # Promoted to the memory tier on the way
+    assert texts(reopened.lookup("prompt", "model")) == ["answer"]
+    assert reopened.metrics()["memory_hits"] == 1
+
+
+def test_entries_expire_after_the_ttl(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now)
+    cache.update("prompt", "model", generations("answer"))
+    now += cache.ttl + 1
+    assert cache.lookup("prompt", "model") is None
+    assert LLMCache(path=cache.path).lookup("prompt", "model") is None
+    assert cache.purge_expired() == 1
+
+
+def test_memory_tier_keeps_the_most_recently_used_entries():
+    cache = LLMCache(path=None, max_entries=2)
+    cache.update("a", "model", generations("a"))
+    cache.update("b", "model", generations("b"))
+    cache.lookup("a", "model")
+    cache.update("c", "model", generations("c"))
+    assert cache.lookup("b", "model") is None
+    assert texts(cache.lookup("a", "model")) == ["a"]
+    assert texts(cache.lookup("c", "model")) == ["c"]
+    assert cache.metrics()["memory_entries"] == 2
+
+
+def test_evicting_recorded_keys_drops_both_tiers(cache):
+    cache.update("kept", "model", generations("ok"))
+    with cache.recording() as keys:
+        cache.lookup("rejected", "model")
+        # Calls running on another thread with the caller's context are recorded too
+        context = contextvars.copy_context()
+        thread = threading.Thread(
+            target=context.run,
+            args=(cache.update, "rejected", "model", generations("{bad json")),
+        )
+        thread.start()
+        thread.join()
+    assert len(set(keys)) == 1
+    assert cache.evict(keys) == 1
+    assert cache.lookup("rejected", "model") is None
+    assert LLMCache(path=cache.path).lookup("rejected", "model") is None
+    assert texts(cache.lookup("kept", "model")) == ["ok"]
+
+
+def test_keys_are_only_recorded_inside_recording(cache):
+    cache.lookup("prompt", "model")
+    with cache.recording() as keys:
+        pass
+    assert keys == []
+    assert cache.evict(keys) == 0
+
+
+class Parsed(BaseModel):
+    value: int
+
+
+def test_responses_with_a_parsed_schema_instance_stay_in_memory(cache):
+    parsed = [
+        ChatGeneration(
+            message=AIMessage(content='{"value": 1}', additional_kwargs={"parsed": Parsed(value=1)})
+        )
+    ]
+    cache.update("prompt", "model", parsed)
+    assert cache.lookup("prompt", "model")[0].message.additional_kwargs["parsed"] == Parsed(value=1)
+    assert LLMCache(path=cache.path).lookup("prompt", "model") is None
+
+
+def test_rows_that_cannot_be_loaded_are_misses(cache):
+    stub = {"lc": 1, "type": "not_implemented", "id": ["tests", "Parsed"], "repr": "Parsed(value=1)"}
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute(
+            "INSERT INTO llm_cache (key, value, expires_at) VALUES (?, ?, NULL)",
+            (cache_key("prompt", "model"), json.dumps([json.dumps(stub)])),
+        )
+    assert cache.lookup("prompt", "model") is None
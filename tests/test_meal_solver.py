@@ -0,0 +1,165 @@
+import pytest
+
+from Agents.meal_solver import (
+    FOOD_CANDIDATES,
+    FoodsCatalog,
+    cost_per_100g,
+    exclusion,
+    food_nutrients,
+    macro_targets,
+    solve_basket,
+)
+
+
+@pytest.mark.parametrize(
+    "name, allergies",
+    [
+        ("Peanut Butter", "Peanuts"),
+        ("Peanut Butter", "Shellfish, Peanuts"),
+        ("Shrimp (frozen)", "shellfish"),
+        ("Slivered Almonds", "Tree nuts; soy"),
+        ("Canned Tuna (in water)", "fish"),
+        ("Large Eggs", "Eggs"),
+        ("Greek Yogurt", "Dairy and gluten"),
+        ("Whole Wheat Bread", "Dairy and gluten"),
+    ],
+)
+def test_allergens_from_the_schema_string_exclude_foods(profile, name, allergies):
+    assert exclusion(name, profile(allergies=allergies)).startswith("allergy:")
+
+
+@pytest.mark.parametrize(
+    "name, allergies",
+    [
+        ("Peanut Butter", "None"),
+        ("Brown Rice", "Peanuts, Shellfish"),
+        ("Coconut Milk", "Tree nuts"),
+        ("Eggplant", "Eggs"),
+    ],
+)
+def test_unrelated_allergies_do_not_exclude(profile, name, allergies):
+    assert exclusion(name, profile(allergies=allergies)) is None
+
+
+def test_diet_preferences_from_the_schema_exclude_foods(profile):
+    vegetarian = profile(diet_preference=["Vegetarian"])
+    assert exclusion("Chicken Breast", vegetarian) == "diet: vegetarian"
+    assert exclusion("Greek Yogurt", profile(diet_preference=["Vegan"])) == "diet: vegan"
+    assert exclusion("Bacon", profile(diet_preference=["Halal"])) == "diet: halal"
+    assert exclusion("Whole Wheat Bread", profile(diet_preference=["Gluten-Free"])) is not None
+    assert exclusion("Tofu", profile(diet_preference=["Vegan", "Gluten-Free"])) is None
+    assert exclusion("Chicken Breast", profile()) is None
+
+
+@pytest.mark.parametrize("goal", ["Weight Loss", "Muscle Gain", "Both"])
+def test_high_protein_goals_raise_the_protein_floor(profile, goal):
+    assert macro_targets(profile(goal=goal)["goal"])["protein"] == (0.25, 0.35)
+
+
+def test_goals_are_normalized():
+    assert macro_targets("weight_loss")["protein"] == (0.25, 0.35)
+    assert macro_targets("  MUSCLE   gain ")["protein"] == (0.25, 0.35)
+
+
+def test_other_goals_keep_the_default_protein_range(profile):
+    assert macro_targets(profile(goal="Stay fit")["goal"])["protein"] == (0.10, 0.35)
+
+
+def test_food_nutrients_reads_both_document_shapes():
+    export = {
+        "foodNutrients": [
+            {"nutrient": {"number": "208", "name": "Energy", "unitName": "kcal"}, "amount": 360},
+            {"nutrient": {"number": "203", "name": "Protein"}, "amount": 7.5},
+        ]
+    }
+    search = {
+        "foodNutrients": [
+            {"nutrientName": "Energy", "unitName": "KCAL", "value": 52},
+            {"nutrientName": "Total lipid (fat)", "value": 0.2},
+        ]
+    }
+    assert food_nutrients(export) == {"calories": 360, "protein": 7.5, "fat": 0.0, "carbs": 0.0}
+    assert food_nutrients(search)["calories"] == 52
+    assert food_nutrients({"foodNutrients": [{"nutrientNumber": "203", "value": 3}]}) is None
+
+
+def test_cost_per_100g():
+    assert cost_per_100g({"prices": "$5.99", "unit_size": "2 kg"}) == pytest.approx(0.2995)
+    assert cost_per_100g({"prices": "$12.66", "unit_size": "$20.92/1kg"}) == pytest.approx(2.092)
+    assert cost_per_100g({"prices": "$9.65", "unit_size": "30 ea"}) is None
+
+
+NUTRIENTS = {  # per 100 g
+    "Chicken Breast": {"calories": 120, "protein": 22.5, "fat": 2.6, "carbs": 0},
+    "Brown Rice": {"calories": 367, "protein": 7.5, "fat": 3.2, "carbs": 76},
+    "Olive Oil": {"calories": 884, "protein": 0, "fat": 100, "carbs": 0},
+    "Spinach": {"calories": 23, "protein": 2.9, "fat": 0.4, "carbs": 3.6},
+    "Peanut Butter": {"calories": 588, "protein": 25, "fat": 50, "carbs": 20},
+}
+ITEMS = [
+    {"name": "Chicken Breast", "prices": "$12.66", "unit_size": "$20.92/1kg"},
+    {"name": "Brown Rice", "prices": "$5.99", "unit_size": "2 kg"},
+    {"name": "Olive Oil", "prices": "$8.99", "unit_size": "1 l"},
+    {"name": "Spinach", "prices": "$2.99", "unit_size": "283.5 g"},
+    {"name": "Peanut Butter", "prices": "$3.49", "unit_size": "1 kg"},
+    {"name": "Eggs", "prices": "$9.65", "unit_size": "30 ea"},
+    {"name": "Quinoa", "prices": "$6.99", "unit_size": "900 g"},
+]
+
+
+def test_solve_basket_meets_calorie_and_macro_targets(profile):
+    result = solve_basket(ITEMS, NUTRIENTS, 2000, 100, profile(goal="Stay fit"))
+    assert result["status"] == "optimal"
+    per_day = result["nutrients_per_day"]
+    assert 1900 <= per_day["calories"] <= 2100
+    protein_share = per_day["protein"] * 4 / per_day["calories"]
+    assert 0.10 - 1e-3 <= protein_share <= 0.35 + 1e-3
+    # Whole packages cost at least the linear price of the grams bought
+    assert result["total_price"] >= result["lp_cost"]
+    assert {item["name"] for item in result["excluded"]} == {"Eggs", "Quinoa"}
+
+
+def test_solve_basket_leaves_out_the_users_allergen(profile):
+    result = solve_basket(ITEMS, NUTRIENTS, 2000, 100, profile(allergies="Peanuts"))
+    assert "Peanut Butter" not in {item["name"] for item in result["items"]}
+    assert {"name": "Peanut Butter", "reason": "allergy: peanuts"} in result["excluded"]
+
+
+def test_solve_basket_is_infeasible_under_a_tiny_budget(profile):
+    result = solve_basket(ITEMS, NUTRIENTS, 2000, 5, profile())
+    assert result["status"] == "infeasible"
+    assert result["items"] == []
+
+
+class FakeFoods:
+    def __init__(self, documents):
+        self.documents = documents
+        self.indexes = []
+        self.pipelines = []
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(self.documents)
+
+
+def test_foods_catalog_sorts_and_limits_on_the_server():
+    rice = {
+        "description": "Rice, brown, long-grain, raw",
+        "foodNutrients": [{"nutrientNumber": "208", "value": 367}],
+    }
+    foods = FakeFoods([rice])
+    catalog = FoodsCatalog(lambda: {"foods": foods})
+    assert catalog.nutrients(["Brown Rice", "brown rice (organic)"]) == {
+        "Brown Rice": food_nutrients(rice),
+        "brown rice (organic)": food_nutrients(rice),
+    }
+    # One query for both names, against a text index
+    assert len(foods.pipelines) == 1
+    assert foods.indexes == [[("description", "text")]]
+    stages = [next(iter(stage)) for stage in foods.pipelines[0]]
+    assert stages == ["$match", "$match", "$project", "$sort", "$limit"]
+    assert foods.pipelines[0][0] == {"$match": {"$text": {"$search": "brown rice"}}}
+    assert foods.pipelines[0][-1] == {"$limit": FOOD_CANDIDATES}
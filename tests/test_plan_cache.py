@@ -0,0 +1,74 @@
+import pytest
+
+from Agents.plan_cache import PlanCache, canonical_name, normalized_set, profile_signature
+
+
+@pytest.fixture
+def signature(profile):
+    """Signature of a profile with the given fields at 2000 kcal and $100"""
+
+    def build(**fields):
+        return profile_signature(profile(**fields), calories=2000, budget=100)
+
+    return build
+
+
+def test_normalized_set_splits_free_text_into_whole_terms():
+    assert normalized_set("Peanuts, Shellfish") == ["peanuts", "shellfish"]
+    assert normalized_set("tree nuts; soy and  Sesame") == ["sesame", "soy", "tree nuts"]
+    assert normalized_set(["Vegan", "Gluten-Free", "vegan"]) == ["gluten-free", "vegan"]
+
+
+def test_normalized_set_drops_placeholders():
+    assert normalized_set("None") == []
+    assert normalized_set("n/a") == []
+    assert normalized_set("") == []
+    assert normalized_set(None) == []
+
+
+def test_signature_separates_allergy_profiles(signature):
+    assert signature(allergies="Peanuts") != signature(allergies="Shellfish")
+    # Same letters, different allergens
+    assert signature(allergies="Peanuts, Shellfish") != signature(allergies="Shellfish, Pea")
+    assert signature(allergies="Peanuts") != signature(allergies="None")
+    assert signature(medical_conditions="Diabetes") != signature(medical_conditions="None")
+
+
+def test_signature_separates_goals(signature):
+    # Same calorie and budget bands, different lists
+    assert signature(goal="Muscle Gain") != signature(goal="Weight Loss")
+    assert profile_signature({"goal": "weight_loss"}, 2000, 100) == profile_signature(
+        {"goal": "Weight Loss"}, 2000, 100
+    )
+
+
+def test_signature_ignores_formatting_of_the_same_terms(signature):
+    assert signature(allergies="Peanuts, Shellfish") == signature(allergies="shellfish and peanuts")
+    assert signature(allergies="None") == signature(allergies="n/a")
+    assert signature(diet_preference=["Vegan", "Halal"]) == signature(
+        diet_preference=["Halal", "Vegan"]
+    )
+
+
+def test_signature_buckets_calories_and_budget(profile):
+    user = profile()
+    assert profile_signature(user, 2010, 101) == profile_signature(user, 2190, 109)
+    assert profile_signature(user, 2010, 101) != profile_signature(user, 2210, 101)
+    assert profile_signature(user, 2010, 101) != profile_signature(user, 2010, 111)
+
+
+def test_canonical_name():
+    assert canonical_name("Greek Yogurt (non-fat)") == canonical_name("greek  yogurt")
+
+
+def test_plan_cache_round_trip_and_ttl(tmp_path, signature):
+    cache = PlanCache(path=str(tmp_path / "plans.sqlite"))
+    key = signature(allergies="Peanuts")
+    assert cache.get(key) is None
+    cache.put(key, {"items": [{"name": "Rice"}]})
+    assert cache.get(key) == {"items": [{"name": "Rice"}]}
+    assert cache.get(signature(allergies="Shellfish")) is None
+
+    expired = PlanCache(path=str(tmp_path / "plans.sqlite"), ttl=-1)
+    assert expired.get(key) is None
+    assert cache.metrics()["hits"] == 1
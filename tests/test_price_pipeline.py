@@ -0,0 +1,49 @@
+import json
+
+from Agents.price_pipeline import IncrementalItemParser
+
+DOCUMENT = json.dumps(
+    {
+        "items": [
+            {"name": "Brown Rice", "quantity": "2 kg", "note": "long {grain} [jasmine]"},
+            {"name": "Eggs \"large\"", "quantity": "1 dozen", "tags": [{"k": "v"}]},
+            {"name": "Spinach", "quantity": "300 g"},
+        ],
+        "total": {"name": "not an item"},
+    }
+)
+
+
+def feed_in_chunks(parser, text, size):
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start : start + size]))
+    return items
+
+
+def test_every_array_item_is_emitted_once_whatever_the_chunking():
+    expected = json.loads(DOCUMENT)["items"]
+    for size in (1, 3, 7, len(DOCUMENT)):
+        assert feed_in_chunks(IncrementalItemParser(), DOCUMENT, size) == expected
+
+
+def test_item_is_emitted_as_soon_as_its_brace_closes():
+    parser = IncrementalItemParser()
+    first = DOCUMENT[: DOCUMENT.index("},") + 1]
+    second = DOCUMENT[len(first) : DOCUMENT.index("}]}") + 3]  # through the nested tags
+    assert [item["name"] for item in parser.feed(first)] == ["Brown Rice"]
+    assert [item["name"] for item in parser.feed(second)] == ['Eggs "large"']
+
+
+def test_objects_without_the_required_key_are_skipped():
+    parser = IncrementalItemParser(required_key="name")
+    assert parser.feed('{"items": [{"quantity": "1"}, {"name": "Kale"}]}') == [{"name": "Kale"}]
+
+
+def test_nested_objects_inside_an_item_are_not_emitted_separately():
+    parser = IncrementalItemParser()
+    assert parser.feed('{"items": [{"name": "x", "tags": [{"name": "y"}]}]}') == [
+        {"name": "x", "tags": [{"name": "y"}]}
+    ]
+    parser = IncrementalItemParser(required_key="k")
+    assert parser.feed('{"items": [{"name": "x", "tags": [{"k": "v"}]}]}') == []
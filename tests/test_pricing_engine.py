@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+import pytest
+
+from Agents.pricing_engine import (
+    COUNT,
+    MEASURE,
+    cart_total,
+    parse_package,
+    parse_quantity,
+    price_matrix,
+)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("2 kg", (MEASURE, 2000.0)),
+        ("1.5 lbs", (MEASURE, 680.388)),
+        ("500 ml", (MEASURE, 500.0)),
+        ("12 fl oz", (MEASURE, 340.194)),
+        ("1/2 cup", (MEASURE, 120.0)),
+        ("2 x 400g", (MEASURE, 800.0)),
+        ("1 dozen", (COUNT, 12.0)),
+        ("3 cans", (COUNT, 3.0)),
+        ("6 pieces", (COUNT, 6.0)),
+        (4, (COUNT, 4.0)),
+    ],
+)
+def test_parse_quantity(text, expected):
+    dimension, amount = parse_quantity(text)
+    assert dimension == expected[0]
+    assert amount == pytest.approx(expected[1], rel=1e-4)
+
+
+@pytest.mark.parametrize("text", ["some", "", None, ["2 kg"]])
+def test_parse_quantity_without_a_number(text):
+    assert parse_quantity(text) is None
+
+
+def test_parse_package_sized_by_measure():
+    package = parse_package({"prices": "$5.99", "unit_size": "2 kg", "title": "Brown Rice"})
+    assert package == {
+        "price": 5.99,
+        "dimension": MEASURE,
+        "size": 2000.0,
+        "per_gram": None,
+        "multi_piece": False,
+    }
+
+
+def test_parse_package_sold_by_weight():
+    package = parse_package({"prices": "$12.66", "unit_size": "$20.92/1kg $9.49/1lb"})
+    assert package["price"] == 12.66
+    assert package["per_gram"] == pytest.approx(0.02092)
+
+
+def test_parse_package_counted():
+    package = parse_package({"prices": "$9.65", "unit_size": "30 ea", "title": "Eggs, Tray"})
+    assert (package["dimension"], package["size"]) == (COUNT, 30.0)
+    assert package["multi_piece"] is False
+
+
+def test_parse_package_multi_piece_without_a_count():
+    bananas = {
+        "title": "Organic Bananas, Bunch",
+        "prices": "$2.40",
+        "unit_size": "$2.18/1kg $0.99/1lb",
+    }
+    assert parse_package(bananas)["multi_piece"] is True
+    assert parse_package({"title": "Kale", "prices": "$2.40 bunch"})["multi_piece"] is True
+    assert parse_package({"title": "Broccoli Crown", "prices": "$1.99"})["multi_piece"] is False
+
+
+def test_price_matrix_buys_whole_packages():
+    result = price_matrix(
+        ["3 kg", "1 dozen", "6 pieces"],
+        [
+            [{"prices": "$5.99", "unit_size": "2 kg"}],
+            [{"prices": "$9.65", "unit_size": "30 ea"}],
+            [{"prices": "$1.99", "unit_size": "1 ea"}],
+        ],
+    )
+    assert result["packages"][:, 0].tolist() == [2.0, 1.0, 6.0]
+    assert result["cost"][:, 0].tolist() == [11.98, 9.65, 11.94]
+
+
+def test_price_matrix_by_weight_and_unknown_piece_counts():
+    chicken = {"prices": "$12.66", "unit_size": "$20.92/1kg $9.49/1lb"}
+    bananas = {"title": "Organic Bananas, Bunch", "prices": "$2.40", "unit_size": "$2.18/1kg"}
+    carrots = {"title": "Carrots, 3 lb Bag", "prices": "$2.99", "unit_size": "1.362 kg"}
+    beans = {"title": "Black Beans", "prices": "$1.29", "unit_size": "540 ml"}
+    result = price_matrix(
+        ["500 g", "6 pieces", "6 pieces", "3 cans"], [[chicken], [bananas], [carrots], [beans]]
+    )
+    # Sold by weight: grams times the per-gram price, no package count
+    assert result["cost"][0, 0] == 10.46
+    assert math.isnan(result["packages"][0, 0])
+    # A bunch or bag of unknown size is one package, not one per piece
+    assert result["cost"][1, 0] == 2.40
+    assert result["cost"][2, 0] == 2.99
+    # Cans of a measured size are still bought one per piece
+    assert result["cost"][3, 0] == 3.87
+
+
+def test_price_matrix_pads_rows_and_skips_unpriced_items():
+    result = price_matrix(
+        ["1 kg", "1"],
+        [
+            [{"prices": "$4.00", "unit_size": "1 kg"}, {"prices": "$3.00", "unit_size": "1 kg"}],
+            [{"prices": "N/A"}],
+        ],
+    )
+    assert result["cost"].shape == (2, 2)
+    assert np.isinf(result["cost"][1]).all()
+    assert cart_total(result["cost"]) == 4.0
+    assert cart_total(result["cost"], np.array([1, 0])) == 3.0
@@ -0,0 +1,104 @@
+import pytest
+
+from Agents.recipe_cache import RecipeCache, available, constraints_key, recipe_uses
+
+
+def recipe(meal_name, *items):
+    return {
+        "meal_name": meal_name,
+        "ingredients": [{"item": item, "quantity": "1 cup"} for item in items],
+        "instructions": ["Cook."],
+    }
+
+
+@pytest.mark.parametrize(
+    "name, ingredients",
+    [
+        ("rice", ["brown rice"]),
+        ("chicken", ["chicken breast"]),
+        ("eggs", ["large eggs"]),
+        ("egg", ["eggs"]),
+        ("spinach", ["baby spinach"]),
+        ("greek yogurt", ["greek yogurt"]),
+    ],
+)
+def test_available_covers_varieties_and_cuts(name, ingredients):
+    assert available(name, ingredients)
+
+
+@pytest.mark.parametrize(
+    "name, ingredients",
+    [
+        ("butter", ["peanut butter"]),
+        ("milk", ["coconut milk"]),
+        ("flour", ["almond flour"]),
+        ("peanut butter", ["butter"]),
+        ("chicken breast fillets", ["chicken breast"]),
+        ("rice", ["rice noodles"]),
+    ],
+)
+def test_available_rejects_different_foods(name, ingredients):
+    assert not available(name, ingredients)
+
+
+def test_recipe_uses_leaves_out_pantry_staples():
+    meal = recipe("Rice bowl", "Brown Rice", "Salt", "Black Pepper", "Olive Oil (extra virgin)")
+    assert recipe_uses(meal) == ["brown rice", "olive oil"]
+
+
+def test_constraints_key_separates_allergy_profiles(profile):
+    assert constraints_key(profile(allergies="Peanuts")) != constraints_key(
+        profile(allergies="Shellfish")
+    )
+    assert constraints_key(profile(allergies="Peanuts")) != constraints_key(profile())
+    assert constraints_key(profile(allergies="Peanuts, Soy")) == constraints_key(
+        profile(allergies="soy and peanuts")
+    )
+    assert constraints_key(profile(), version="1") != constraints_key(profile(), version="2")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RecipeCache(path=str(tmp_path / "recipes.sqlite"))
+
+
+def test_exact_ingredient_set_is_served_first(cache, profile):
+    user = profile()
+    ingredients = ["Brown Rice", "Chicken Breast", "Broccoli"]
+    cache.put(user, ["Brown Rice"], [recipe("Plain rice", "Brown Rice")])
+    cache.put(user, ingredients, [recipe("Chicken bowl", "Chicken Breast", "Brown Rice")])
+    names = [meal["meal_name"] for meal in cache.lookup(user, ingredients, limit=7)]
+    assert names == ["Chicken bowl", "Plain rice"]
+
+
+def test_subset_recipes_need_every_ingredient(cache, profile):
+    user = profile()
+    cache.put(user, ["Butter", "Bread"], [recipe("Toast", "Butter", "Bread")])
+    cache.put(user, ["Oats", "Milk"], [recipe("Porridge", "Rolled Oats", "Milk")])
+    assert cache.lookup(user, ["Peanut Butter", "Bread"], limit=7) == []
+    assert cache.lookup(user, ["Oats", "Coconut Milk"], limit=7) == []
+    found = cache.lookup(user, ["Bread", "Butter", "Eggs"], limit=7)
+    assert [meal["meal_name"] for meal in found] == ["Toast"]
+
+
+def test_recipes_do_not_cross_allergy_profiles(cache, profile):
+    ingredients = ["Bread", "Peanut Butter"]
+    cache.put(profile(allergies="Shellfish"), ingredients, [recipe("PB toast", *ingredients)])
+    assert cache.lookup(profile(allergies="Peanuts"), ingredients, limit=7) == []
+    assert len(cache.lookup(profile(allergies="shellfish"), ingredients, limit=7)) == 1
+
+
+def test_lookup_is_distinct_by_meal_name_and_limited(cache, profile):
+    user = profile()
+    ingredients = ["Brown Rice", "Eggs"]
+    cache.put(user, ingredients, [recipe("Egg fried rice", "Eggs", "Brown Rice")] * 2)
+    cache.put(user, ingredients, [recipe("Boiled eggs", "Eggs"), recipe("Rice", "Brown Rice")])
+    assert len(cache.lookup(user, ingredients, limit=7)) == 3
+    assert len(cache.lookup(user, ingredients, limit=2)) == 2
+    assert cache.metrics()["full_hits"] == 1
+
+
+def test_expired_recipes_are_not_served(tmp_path, profile):
+    cache = RecipeCache(path=str(tmp_path / "recipes.sqlite"), ttl=-1)
+    cache.put(profile(), ["Eggs"], [recipe("Boiled eggs", "Eggs")])
+    assert cache.lookup(profile(), ["Eggs"], limit=7) == []
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+# master_agent prompts for a key on import when none is set
+os.environ.setdefault("OPENAI_API_KEY", "offline-test")
+
+import Agents.master_agent as master_agent
+from Agents.llm_cache import LLMCache
+from Agents.model_router import ModelRouter
+
+RECIPE = {
+    "meal_name": "Egg fried rice",
+    "ingredients": [{"item": "Brown Rice", "quantity": "1 cup"}],
+    "instructions": ["Cook the rice.", "Fry with the eggs."],
+    "nutritional_info": {"protein": "20 g", "carbs": "60 g", "fat": "12 g", "calories": "430"},
+}
+PROFILE = {
+    "age": 30,
+    "diet_preference": ["Omnivore"],
+    "allergies": ["None"],
+    "medical_conditions": ["None"],
+    "goal": "Muscle Gain",
+}
+
+
+class AnswerSequence(BaseChatModel):
+    """Answers structured calls with the next RecipeSet arguments, the last one repeating"""
+
+    _answers: list = PrivateAttr()
+    _calls: int = PrivateAttr(default=0)
+
+    def __init__(self, answers, **kwargs):
+        super().__init__(**kwargs)
+        self._answers = answers
+
+    @property
+    def _llm_type(self) -> str:
+        return "answer-sequence"
+
+    def bind_tools(self, tools, **kwargs):
+        kwargs.pop("ls_structured_output_format", None)
+        return self.bind(tools=[tool.__name__ for tool in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        args = self._answers[min(self._calls, len(self._answers) - 1)]
+        self._calls += 1
+        message = AIMessage(
+            content="", tool_calls=[{"name": "RecipeSet", "args": args, "id": "call_0"}]
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    """Install a cached model giving the answers in order; returns it for call counting"""
+
+    def install(*sequence):
+        cache = LLMCache(path=None)
+        model = AnswerSequence(list(sequence), cache=cache)
+        monkeypatch.setattr(master_agent, "llm_cache", cache)
+        monkeypatch.setattr(
+            master_agent,
+            "model_router",
+            ModelRouter(lambda model_name, timeout: model, tiers={"fast": "m", "quality": "m"}),
+        )
+        return model
+
+    return install
+
+
+@pytest.mark.parametrize(
+    "invalid",
+    [
+        {"recipes": "not a list"},
+        {"recipes": []},
+    ],
+)
+def test_retry_reaches_the_model_after_an_invalid_answer(answers, invalid):
+    model = answers(invalid, {"recipes": [RECIPE]})
+    recipes = master_agent.generate_day_recipes(PROFILE, ["Brown Rice", "Eggs"], day=1)
+    assert [recipe["meal_name"] for recipe in recipes] == ["Egg fried rice"]
+    assert model._calls == 2
+    assert master_agent.llm_cache.metrics()["evictions"] == 1
+
+
+def test_valid_answers_are_still_served_from_the_cache(answers):
+    model = answers({"recipes": [RECIPE]})
+    for _ in range(2):
+        assert master_agent.generate_day_recipes(PROFILE, ["Brown Rice"], day=1)
+    assert model._calls == 1
+    assert master_agent.llm_cache.metrics()["memory_hits"] == 1
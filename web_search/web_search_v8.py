@@ -1,5 +1,6 @@
 import time
 import json
+from contextlib import contextmanager
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -102,9 +103,9 @@ def extract_results(driver, search_term):
     return results
 
 
-def search_grocery_tracker(store_type_value, specific_store_value, grocery_items, out_file):
+def create_driver():
     """
-    Automates the Grocery Tracker website to select a store and perform a search for a list of grocery items.
+    Start a headless Chrome driver.
     """
     # Automatically install ChromeDriver
     chromedriver_autoinstaller.install()
@@ -115,72 +116,108 @@ def search_grocery_tracker(store_type_value, specific_store_value, grocery_items
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
 
-    driver = webdriver.Chrome(options=options)
+    return webdriver.Chrome(options=options)
 
-    try:
-        ingredients = []
-
-        for search_term in grocery_items:
-            print(f"Searching for: {search_term}")
-
-            # Open Grocery Tracker website and refresh for each search
-            driver.get("https://grocerytracker.ca/")
-            print("Page loaded.")
-
-            # Select the store type (e.g., "No Frills")
-            attempt = 0
-            while attempt <= 2:
-                try:
-                    store_type_dropdown = WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, "select.form-select"))
-                    )
-                    store_type_selector = Select(store_type_dropdown)
-                    store_type_selector.select_by_value(store_type_value)
-                    print(f"Selected store type: {store_type_value}")
-
-                    # Select the specific store (e.g., "Rocco's NOFRILLS Toronto")
-                    specific_store_dropdown = WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located((By.XPATH, "//select[@class='form-select'][2]"))
-                    )
-                    specific_store_selector = Select(specific_store_dropdown)
-                    specific_store_selector.select_by_value(specific_store_value)
-                    print(f"Selected specific store: {specific_store_value}")
-                    break
-                except Exception as e:
-                    print(f"Error selecting store: {e}. Retrying in 2 seconds... (Attempt {attempt + 1}/3)")
-                    attempt += 1
-                    time.sleep(2)
-                    driver.get("https://grocerytracker.ca/")  # Reload the website
-            else:
-                raise Exception("Failed to select store after retries.")
-
-            # Locate the search bar with retry
-            search_box = locate_search_bar(driver)
-            search_box.clear()
-            search_box.send_keys(search_term)
-
-            # Click the search button with retry
-            click_search_button(driver)
-
-            # Wait for search results to load
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".col .card.border-dark"))
+
+def search_item(driver, store_type_value, specific_store_value, search_term):
+    """
+    Search Grocery Tracker for one item and return its cheapest product (with every scraped candidate), or None.
+    """
+    print(f"Searching for: {search_term}")
+
+    # Open Grocery Tracker website and refresh for each search
+    driver.get("https://grocerytracker.ca/")
+    print("Page loaded.")
+
+    # Select the store type (e.g., "No Frills")
+    attempt = 0
+    while attempt <= 2:
+        try:
+            store_type_dropdown = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "select.form-select"))
             )
-            print("Search results loaded.")
+            store_type_selector = Select(store_type_dropdown)
+            store_type_selector.select_by_value(store_type_value)
+            print(f"Selected store type: {store_type_value}")
+
+            # Select the specific store (e.g., "Rocco's NOFRILLS Toronto")
+            specific_store_dropdown = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.XPATH, "//select[@class='form-select'][2]"))
+            )
+            specific_store_selector = Select(specific_store_dropdown)
+            specific_store_selector.select_by_value(specific_store_value)
+            print(f"Selected specific store: {specific_store_value}")
+            break
+        except Exception as e:
+            print(f"Error selecting store: {e}. Retrying in 2 seconds... (Attempt {attempt + 1}/3)")
+            attempt += 1
+            time.sleep(2)
+            driver.get("https://grocerytracker.ca/")  # Reload the website
+    else:
+        raise Exception("Failed to select store after retries.")
+
+    # Locate the search bar with retry
+    search_box = locate_search_bar(driver)
+    search_box.clear()
+    search_box.send_keys(search_term)
+
+    # Click the search button with retry
+    click_search_button(driver)
+
+    # Wait for search results to load
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, ".col .card.border-dark"))
+    )
+    print("Search results loaded.")
+
+    # Extract results
+    results = extract_results(driver, search_term)
 
-            # Extract results
-            results = extract_results(driver, search_term)
+    # Find the cheapest product by numeric unit price
+    if not results:
+        print(f"No results found for {search_term}.")
+        return None
 
-            # Find the cheapest product by numeric unit price
-            if results:
-                cheapest_product = min(results, key=lambda x: x["numeric_unit_price"])
-                print(f"Cheapest product for {search_term}: {cheapest_product['title']} - {cheapest_product['unit_price']}")
-                ingredients.append(cheapest_product)
-            else:
-                print(f"No results found for {search_term}.")
+    cheapest_product = min(results, key=lambda x: x["numeric_unit_price"])
+    print(f"Cheapest product for {search_term}: {cheapest_product['title']} - {cheapest_product['unit_price']}")
+    # Keep every scraped product so the budget optimizer can swap to an alternative
+    return {**cheapest_product, "candidates": results}
 
-            # Wait for 3 seconds before the next search
+
+@contextmanager
+def grocery_tracker_session(store_type_value, specific_store_value):
+    """
+    Keep one browser open and yield a search(term) function for item-by-item lookups.
+    Failed searches return None instead of aborting the session.
+    """
+    driver = create_driver()
+    searches = 0
+
+    def search(search_term):
+        nonlocal searches
+        if searches:
+            # Wait for 3 seconds between searches
             time.sleep(3)
+        searches += 1
+        try:
+            return search_item(driver, store_type_value, specific_store_value, search_term)
+        except Exception as e:
+            print(f"An error occurred searching for {search_term}: {e}")
+            return None
+
+    try:
+        yield search
+    finally:
+        driver.quit()
+
+
+def search_grocery_tracker(store_type_value, specific_store_value, grocery_items, out_file):
+    """
+    Automates the Grocery Tracker website to select a store and perform a search for a list of grocery items.
+    """
+    try:
+        with grocery_tracker_session(store_type_value, specific_store_value) as search:
+            ingredients = [product for product in map(search, grocery_items) if product]
 
         # Save all ingredients to a JSON file
         with open(out_file, "w") as f:
@@ -190,9 +227,6 @@ def search_grocery_tracker(store_type_value, specific_store_value, grocery_items
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    finally:
-        driver.quit()
-
 
 # Example usage
 if __name__ == "__main__":